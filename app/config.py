@@ -5,22 +5,128 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
+    # Logging (set up by the entry points: run.py, batch.py, realtime_speechmatics_GPT.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # "text" or "json" (one object per line)
+    LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; more are dropped, not waited for
+    LOG_DEBUG_SAMPLE_EVERY = 100  # Keep one in this many per-poll debug records
+
     # API Keys
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     SPEECHMATICS_AUTH_TOKEN = os.getenv('SPEECHMATICS_AUTH_TOKEN')
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')  # Alternative OpenAI-compatible endpoint, e.g. a local mock
 
     # Speechmatics Configuration
     SPEECHMATICS_URL = "wss://eu2.rt.speechmatics.com/v2"
+    SPEECHMATICS_MAX_DELAY = 2.5  # Seconds the recogniser may wait for context before finalising words
     
     # Translation Configuration
     SOURCE_LANGUAGE = "fa"  # Persian
     TARGET_LANGUAGES = ["en", "nl"]  # English & Dutch
+    TRANSLATION_WORKERS = 3  # Concurrent GPT requests
+    TRANSLATION_MAX_PENDING = 8  # Segments allowed to wait for a worker
+    TRANSLATION_QUEUE_POLICY = "block"  # "block", "merge" or "drop_oldest" when the backlog is full
+    TRANSLATION_MERGE_MAX_WORDS = 40  # "merge" stops growing a queued segment here and blocks instead
+    TRANSLATION_MAX_BATCH = 4  # Queued segments packed into one GPT request
+    TRANSLATION_BATCH_MAX_WAIT = 0.05  # Seconds a partial batch may wait to fill
+    TRANSLATION_STREAMING = True  # Publish each language as soon as its line is generated
+
+    # GPT request deadlines, hedging and retries
+    TRANSLATION_MODEL = "gpt-4"
+    TRANSLATION_FALLBACK_MODEL = "gpt-3.5-turbo"  # Used for hedged requests; None hedges with TRANSLATION_MODEL
+    TRANSLATION_DEADLINE = 8.0  # Seconds a segment may spend in translation, retries included
+    TRANSLATION_REQUEST_TIMEOUT = 6.0  # Seconds before a single HTTP request is abandoned
+    TRANSLATION_HEDGE_QUANTILE = 0.95  # Send a backup request once the first is slower than this quantile
+    TRANSLATION_HEDGE_DEFAULT_DELAY = 2.5  # Hedge delay until enough request durations have been seen
+    TRANSLATION_HEDGE_MIN_DELAY = 0.5
+    TRANSLATION_RETRIES = 2  # Extra attempts after a failed request, within the deadline
+    TRANSLATION_RETRY_BASE_DELAY = 0.25  # Backoff before the first retry; doubles each retry, with jitter
+
+    # Shared OpenAI client (one per process; rate limits are learned from the response headers)
+    OPENAI_MAX_CONNECTIONS = 10  # Pooled HTTP connections; covers every worker plus its hedge
+    OPENAI_KEEPALIVE_EXPIRY = 120.0  # Seconds an idle pooled connection is kept open
+    OPENAI_WARMUP_CONNECTIONS = 2  # Connections opened at startup, before the first caption
+    OPENAI_MAX_THROTTLE = 5.0  # Longest a request waits for the rate limiter before failing fast
+
+    # Translation cache
+    TRANSLATION_CACHE_SIZE = 2048  # Entries kept in memory, 0 disables the cache
+    TRANSLATION_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached translation expires
+    TRANSLATION_CACHE_FILE = "data/translation_cache.db"  # Persistent tier, None for memory only
+    TRANSLATION_CACHE_WARMUP_FILE = os.getenv('TRANSLATION_CACHE_WARMUP_FILE')  # Phrase list preloaded at start
+
+    # Speculative translation of partial transcripts
+    SPECULATIVE_TRANSLATION = False  # Subscribe to partials and translate stable prefixes early
+    SPECULATION_STABLE_PARTIALS = 2  # Partials a prefix must survive unchanged
+    SPECULATION_MIN_WORDS = 4  # Shortest prefix worth translating
+    SPECULATION_MAX_IN_FLIGHT = 2  # Concurrent speculative GPT requests
 
     # Audio Configuration
     CHUNK_SIZE = 512
     SAMPLE_RATE = 16000
     CHANNELS = 1
     FORMAT = "pcm_s16le"
+    SEND_CHUNK_SIZE = 8192  # Max bytes per websocket frame; buffered audio is sent in frames up to this size
+    AUDIO_MAX_LAG = 5.0  # Seconds of unsent audio kept; older audio is dropped to catch up
+
+    # Multi-stream mode (run.py --streams): comma-separated stream ids, each optionally
+    # followed by =<PyAudio input device index>, e.g. "hall=2,room-b=5"
+    STREAMS = os.getenv('STREAMS', '')
+
+    # Speechmatics reconnects (exponential backoff; unconfirmed audio is resent on the new session)
+    RECONNECT_INITIAL_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 10.0
+    RECONNECT_REPLAY_SECONDS = 10.0  # Max seconds of sent but unfinalised audio kept for resending
+
+    # Voice activity gate (silence is reduced to keep-alive chunks)
+    VAD_ENABLED = True
+    VAD_THRESHOLD_DB = -45.0  # Chunk level (dBFS) treated as speech
+    VAD_HANGOVER = 3.0  # Seconds sent after speech stops; keep above max_delay
+    VAD_PRE_ROLL = 0.3  # Seconds of audio replayed before speech onset
+    VAD_KEEPALIVE_INTERVAL = 1.0  # Seconds between silent keep-alive chunks
+
+    # Segmentation Configuration
+    SEGMENT_MAX_WORDS = 10  # Cut a segment once it reaches this many words
+    SEGMENT_MAX_DURATION = 6.0  # Seconds of speech before a segment is cut
+    SEGMENT_PAUSE_THRESHOLD = 0.8  # Silence between words (seconds) that ends a segment
+
+    # Latency control: while running, settings are retuned to hold the caption delay
+    # (first word of a segment spoken -> caption saved) near the target. Settings
+    # start at their configured values, are only ever moved towards lower latency
+    # up to these bounds, and return to the configured values when there is headroom.
+    LATENCY_CONTROL = True
+    LATENCY_TARGET = 5.0  # Seconds
+    LATENCY_TOLERANCE = 0.15  # No change while the delay is within this fraction of the target
+    LATENCY_CHECK_INTERVAL = 5.0  # Seconds between decisions; at most one change per decision
+    LATENCY_WINDOW = 20  # Recent segments whose median delay is compared with the target
+    LATENCY_MIN_SAMPLES = 3  # Segments saved since the last change before deciding again
+    LATENCY_TRANSLATION_SHARE = 0.4  # Translations slower than this share of the target count as slow
+    LATENCY_MIN_SEGMENT_WORDS = 5
+    LATENCY_MIN_SEGMENT_DURATION = 3.0
+    LATENCY_MIN_MAX_DELAY = 1.0  # Speechmatics accepts 0.7 and up
+    LATENCY_MAX_BATCH = 8  # Largest GPT batch used to work off a translation backlog
+    LATENCY_FAST_MODEL = "gpt-3.5-turbo"  # Used instead of TRANSLATION_MODEL under load; None never switches
+    LATENCY_MODEL_HOLD = 30.0  # Seconds on the fast model before switching back is considered
+    LATENCY_HISTORY = 100  # Adjustments kept for /api/latency
+
+    # Offline batch mode (batch.py)
+    BATCH_MAX_SESSIONS = 4  # Files transcribed at once, one Speechmatics session each
+    BATCH_TRANSLATION_WORKERS = 6
+    BATCH_TRANSLATION_MAX_PENDING = 32
+    BATCH_MAX_DELAY = 5.0  # No live audience, so give the recogniser more context
+    BATCH_TRANSLATION_TIMEOUT = 300.0  # Seconds a transcribed file waits for its translations before it fails
+    BATCH_STREAM = "batch"  # Store the captions under data/streams/<id>/, away from the live store
+
+    # Store rotation: the live segment is archived to data/archive/ (gzipped JSON lines)
+    STORE_ROTATE_ON_START = True  # Each session starts a new segment
+    STORE_SEGMENT_MAX_ROWS = 5000  # Archive the live segment once it holds this many rows...
+    STORE_SEGMENT_MAX_AGE = 6 * 3600  # ...or its oldest row is this many seconds old
+    STORE_ROTATE_CHECK_INTERVAL = 60.0
+
+    # Delivery Configuration (seconds)
+    LONG_POLL_TIMEOUT = 25.0  # Longest a long-poll request is held open
+    SSE_KEEPALIVE_INTERVAL = 15.0  # Comment line sent to idle event streams
+    STORE_RECHECK_INTERVAL = 1.0  # Fallback store check for writers in another process
+    READ_MAX_LIMIT = 100  # Most transcriptions one ?limit= request may take
 
     @classmethod
     def validate(cls):
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from ..config import Config
+from ..models.metrics import SEGMENTS, SegmentTrace
+from ..models import openai_client
+from ..models.translation_model import TranslationModel
+from .transcription_controller import TranscriptionController
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAudioSource:
+    """
+    PyAudio callback stream feeding a bounded asyncio queue.
+
+    read() is a coroutine, so the Speechmatics client awaits audio on the
+    event loop instead of blocking a reader thread. When the queue is full
+    the oldest chunk is dropped, the same catch-up rule as AudioRingBuffer.
+    Before handing audio to the client, read() awaits `wait_ready`, which is
+    how a full translation backlog holds back the upstream stages.
+    """
+
+    def __init__(self, loop, gate=None, maxsize=0, wait_ready=None):
+        self.loop = loop
+        self.gate = gate
+        self.wait_ready = wait_ready
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._leftover = b""
+        self._closed = False
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream_callback; runs on the PortAudio thread"""
+        import pyaudio
+        self.loop.call_soon_threadsafe(self._push, in_data)
+        return None, pyaudio.paContinue
+
+    def _push(self, data):
+        for chunk in self.gate.process(data) if self.gate else (data,):
+            self._put(chunk)
+
+    def _put(self, chunk):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(chunk)
+
+    def close(self):
+        """End the stream once the queued audio has been read; safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self._put, None)
+
+    async def read(self, num_bytes):
+        if self.wait_ready:
+            await self.wait_ready()
+
+        parts = [self._leftover] if self._leftover else []
+        size = len(self._leftover)
+        if not parts and not self._closed:
+            data = await self.queue.get()
+            if data is None:
+                self._closed = True
+            else:
+                parts.append(data)
+                size += len(data)
+        while size < num_bytes and not self._closed and not self.queue.empty():
+            data = self.queue.get_nowait()
+            if data is None:
+                self._closed = True
+            else:
+                parts.append(data)
+                size += len(data)
+
+        data = b"".join(parts)
+        self._leftover = data[num_bytes:]
+        return data[:num_bytes]
+
+
+class AsyncTranscriptionPipeline:
+    """
+    Single event loop version of the TranscriptionController pipeline:
+    audio source -> Speechmatics WebsocketClient.run -> segmenter ->
+    async OpenAI translation -> store and broadcast.
+
+    Stages are connected by asyncio queues with explicit backpressure: once
+    TRANSLATION_MAX_PENDING segments are waiting, the audio source stops
+    handing audio to the websocket, and the bounded audio queue drops its
+    oldest audio rather than growing. Results are committed in speech order.
+    stop() ends the audio stream, which lets Speechmatics finalise the last
+    words; the remaining segments are then translated and stored before run()
+    returns. Cancelling run() stops every stage immediately.
+    """
+
+    def __init__(self, controller=None):
+        self.controller = controller or TranscriptionController(capture_audio=False)
+        self.audio = None
+        self._loop = None
+
+    async def run(self):
+        import speechmatics.client
+        from speechmatics.models import ServerMessageType
+        controller = self.controller
+        self._loop = asyncio.get_running_loop()
+        self._segments = asyncio.Queue()
+        self._room = asyncio.Condition()
+        self._commit_lock = asyncio.Lock()
+        self._results = {}
+        self._next_seq = 0
+        self._next_commit = 0
+
+        chunks_per_second = Config.SAMPLE_RATE / Config.CHUNK_SIZE
+        self.audio = AsyncAudioSource(
+            self._loop,
+            gate=controller.vad_gate,
+            maxsize=max(1, int(Config.AUDIO_MAX_LAG * chunks_per_second)),
+            wait_ready=self._wait_for_room
+        )
+        ws = speechmatics.client.WebsocketClient(controller.connection_settings())
+        ws.add_event_handler(
+            event_name=ServerMessageType.AddTranscript,
+            event_handler=self._handle_final_transcript
+        )
+
+        warm_up = asyncio.ensure_future(openai_client.awarm_up(Config.OPENAI_WARMUP_CONNECTIONS))
+        workers = [asyncio.ensure_future(self._translate_worker()) for _ in range(Config.TRANSLATION_WORKERS)]
+        try:
+            controller._init_audio(stream_callback=self.audio.callback)
+            print("Transcription system started (asyncio). Speak in Persian...")
+            config, settings = controller.transcription_settings()
+            try:
+                await ws.run(self.audio, config, settings)
+            except Exception as e:
+                print(f"Transcription error: {e}")
+
+            segment = controller.segmenter.flush()
+            if segment:
+                self._enqueue(segment.text)
+            for _ in workers:
+                self._segments.put_nowait(None)
+            await asyncio.gather(*workers)
+        finally:
+            warm_up.cancel()
+            for worker in workers:
+                worker.cancel()
+            if hasattr(controller, 'stream'):
+                controller.stream.stop_stream()
+                controller.stream.close()
+            if hasattr(controller, 'p'):
+                controller.p.terminate()
+            print("Transcription system stopped.")
+
+    def stop(self):
+        """Request a graceful shutdown; safe to call from any thread"""
+        if self.audio:
+            self.audio.close()
+
+    def _handle_final_transcript(self, msg):
+        for segment in self.controller.segmenter.feed(msg):
+            self._enqueue(segment.text)
+
+    def _enqueue(self, text):
+        SEGMENTS.inc()
+        self._segments.put_nowait((self._next_seq, text, SegmentTrace()))
+        self._next_seq += 1
+
+    async def _wait_for_room(self):
+        async with self._room:
+            await self._room.wait_for(lambda: self._segments.qsize() < Config.TRANSLATION_MAX_PENDING)
+
+    async def _translate_worker(self):
+        while True:
+            item = await self._segments.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < Config.TRANSLATION_MAX_BATCH and not self._segments.empty():
+                item = self._segments.get_nowait()
+                if item is None:
+                    # Leave the shutdown marker for after this batch
+                    self._segments.put_nowait(None)
+                    break
+                batch.append(item)
+            async with self._room:
+                self._room.notify_all()
+
+            for _, _, trace in batch:
+                trace.mark('translation_started')
+            try:
+                results = await self.controller.translation_model.atranslate_batch([text for _, text, _ in batch])
+            except Exception as e:
+                logger.error("Translation of segments %s failed: %s", [seq for seq, _, _ in batch], e)
+                # Still committed, so the caption is saved untranslated instead of disappearing
+                results = [TranslationModel.failed(e) for _ in batch]
+            for (seq, text, trace), translations in zip(batch, results):
+                trace.mark('translation_finished')
+                self._results[seq] = (text, translations, trace)
+            await self._commit_ready()
+
+    async def _commit_ready(self):
+        """Store every translated segment that is next in speech order"""
+        async with self._commit_lock:
+            while self._next_commit in self._results:
+                text, translations, trace = self._results.pop(self._next_commit)
+                self._next_commit += 1
+                # SQLite writes stay off the event loop
+                try:
+                    await self._loop.run_in_executor(
+                        None, self.controller._commit_translation, text, translations, trace
+                    )
+                except Exception as e:
+                    logger.error("Committing segment %s failed: %s", self._next_commit - 1, e)
@@ -0,0 +1,272 @@
+import bisect
+import math
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class VoiceActivityGate:
+    """
+    Energy-based voice activity gate for 16-bit PCM chunks.
+
+    Chunks louder than `threshold_db` (dBFS) open the gate. It stays open for
+    `hangover` seconds after the level drops, which must cover the
+    recogniser's max_delay so the last words of an utterance still get
+    finalised. While the gate is closed, the most recent `pre_roll` seconds
+    are held back and sent ahead of the next loud chunk, so word onsets are
+    not clipped. Otherwise only one silent keep-alive chunk is sent every
+    `keepalive_interval` seconds.
+    """
+
+    def __init__(self, sample_rate, threshold_db=-45.0, hangover=3.0, pre_roll=0.3,
+                 keepalive_interval=1.0, sample_width=2):
+        self.bytes_per_second = sample_rate * sample_width
+        self.threshold_db = threshold_db
+        self.hangover = hangover
+        self.pre_roll = pre_roll
+        self.keepalive_interval = keepalive_interval
+
+        self._pre_roll = deque()
+        self._pre_roll_bytes = 0
+        self._active = False
+        self._quiet_for = 0.0
+        self._since_sent = 0.0
+
+    @staticmethod
+    def level_db(data):
+        """RMS level of a pcm_s16le chunk in dBFS"""
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if not samples.size:
+            return -math.inf
+        rms = math.sqrt(float(np.dot(samples, samples)) / samples.size)
+        return 20 * math.log10(max(rms, 1.0) / 32768.0)
+
+    def process(self, data):
+        """Return the chunks to send for one captured chunk (possibly none)"""
+        duration = len(data) / self.bytes_per_second
+
+        if self.level_db(data) >= self.threshold_db:
+            chunks = list(self._pre_roll)
+            chunks.append(data)
+            self._pre_roll.clear()
+            self._pre_roll_bytes = 0
+            self._active = True
+            self._quiet_for = 0.0
+            self._since_sent = 0.0
+            return chunks
+
+        if self._active:
+            self._quiet_for += duration
+            if self._quiet_for <= self.hangover:
+                self._since_sent = 0.0
+                return [data]
+            self._active = False
+
+        self._pre_roll.append(data)
+        self._pre_roll_bytes += len(data)
+        while self._pre_roll_bytes - len(self._pre_roll[0]) >= self.pre_roll * self.bytes_per_second:
+            self._pre_roll_bytes -= len(self._pre_roll.popleft())
+
+        self._since_sent += duration
+        if self._since_sent >= self.keepalive_interval:
+            self._since_sent = 0.0
+            return [bytes(len(data))]
+        return []
+
+
+class AudioRingBuffer:
+    """
+    Preallocated byte ring between audio capture and the websocket.
+
+    Holds at most `max_lag` seconds of audio. A write that would exceed that
+    discards the oldest audio, so after a stall the stream catches up with
+    real time instead of sending ever staler audio. read() has the
+    file-like interface the Speechmatics client expects: it blocks until
+    audio is available and returns everything buffered, up to `num_bytes`,
+    in one frame. After close() it drains the buffer and then returns b"".
+
+    It also remembers when recent audio was written, so captured_at() can
+    map a Speechmatics timestamp back to the moment that audio was captured.
+    """
+
+    def __init__(self, bytes_per_second, max_lag=5.0, sample_width=2, timeline_length=4096):
+        self.bytes_per_second = bytes_per_second
+        # Whole samples only, so dropping audio never splits one
+        self.capacity = int(bytes_per_second * max_lag) // sample_width * sample_width
+        self._buffer = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped_bytes = 0
+        self._written = 0
+        self._timeline = deque(maxlen=timeline_length)  # (bytes written so far, monotonic time)
+        self._read = 0
+        self._reads = deque(maxlen=timeline_length)  # (bytes read so far, bytes dropped before this read)
+
+    @property
+    def lag_seconds(self):
+        """Seconds of captured audio waiting to be sent"""
+        with self._cond:
+            return self._size / self.bytes_per_second
+
+    @property
+    def dropped_seconds(self):
+        with self._cond:
+            return self.dropped_bytes / self.bytes_per_second
+
+    def write(self, data):
+        with self._cond:
+            if self._closed:
+                return
+            if len(data) > self.capacity:
+                self.dropped_bytes += len(data) - self.capacity
+                data = data[-self.capacity:]
+            overflow = self._size + len(data) - self.capacity
+            if overflow > 0:
+                self._start = (self._start + overflow) % self.capacity
+                self._size -= overflow
+                self.dropped_bytes += overflow
+
+            end = (self._start + self._size) % self.capacity
+            first = min(len(data), self.capacity - end)
+            self._buffer[end:end + first] = data[:first]
+            self._buffer[:len(data) - first] = data[first:]
+            self._size += len(data)
+            self._written += len(data)
+            self._timeline.append((self._written, time.monotonic()))
+            self._cond.notify_all()
+
+    def read(self, num_bytes):
+        with self._cond:
+            self._cond.wait_for(lambda: self._size or self._closed)
+            count = min(num_bytes, self._size)
+            first = min(count, self.capacity - self._start)
+            view = memoryview(self._buffer)
+            data = b"".join((view[self._start:self._start + first], view[:count - first]))
+            view.release()
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            if count:
+                # Audio is dropped from the oldest end, so every byte dropped so far came before this read
+                self._read += count
+                self._reads.append((self._read, self.dropped_bytes))
+            return data
+
+    def captured_at(self, audio_seconds):
+        """
+        Monotonic time at which the audio `audio_seconds` into the sent stream was written,
+        or None once it has left the timeline. Dropped audio never reached the
+        websocket, so the audio dropped before that point is added back to the offset.
+        """
+        with self._cond:
+            offset = int(audio_seconds * self.bytes_per_second)
+            index = bisect.bisect_right(self._reads, (offset, float('inf')))
+            if index == 0 and len(self._reads) == self._reads.maxlen:
+                return None
+            offset += self._reads[index][1] if index < len(self._reads) else self.dropped_bytes
+            index = bisect.bisect_left(self._timeline, (offset,))
+            if index == len(self._timeline) or (index == 0 and len(self._timeline) == self._timeline.maxlen):
+                return None
+            return self._timeline[index][1]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class ReplayableAudioStream:
+    """
+    Wraps the audio source of a Speechmatics session so it can resume on a new connection.
+
+    Every frame handed to the websocket is kept until the server has both
+    acknowledged it (AudioAdded seq_no) and finalised the transcript past its
+    end, at most `max_replay` seconds of it. After a reconnect, new_session()
+    queues the kept frames to be sent again before any new audio, and returns
+    where the new session starts on the continuous timeline so transcript
+    timings can be stitched across sessions.
+    """
+
+    def __init__(self, source, bytes_per_second, max_replay=10.0):
+        self.source = source
+        self.bytes_per_second = bytes_per_second
+        self.max_replay_bytes = int(bytes_per_second * max_replay)
+        self._lock = threading.Lock()
+        self._frames = deque()  # [stream offset, data] sent but not yet released
+        self._frame_bytes = 0
+        self._session = 0
+        self._session_frames = []  # stream end offset of each frame sent in this session, by seq_no - 1
+        self._replay = deque()
+        self._offset = 0  # stream bytes read from the source so far
+        self._acked = 0  # stream offset acknowledged by the server
+        self._final = 0  # stream offset covered by final transcripts
+        self._lost_until = 0
+        self.finished = False
+        self.replayed_bytes = 0
+        self.lost_bytes = 0
+
+    def read(self, num_bytes):
+        with self._lock:
+            if self._replay:
+                start, data = self._replay.popleft()
+                self._session_frames.append(start + len(data))
+                return data
+            session = self._session
+
+        data = self.source.read(num_bytes)
+        with self._lock:
+            if not data:
+                self.finished = True
+                return data
+            start = self._offset
+            self._offset += len(data)
+            self._frames.append([start, data])
+            self._frame_bytes += len(data)
+            if session == self._session:
+                self._session_frames.append(self._offset)
+            else:
+                # A read left over from a dropped connection; send it on the current one
+                self._replay.append([start, data])
+            while self._frame_bytes > self.max_replay_bytes:
+                # Too much unconfirmed audio to keep; the oldest can no longer be resent
+                _, dropped = self._frames.popleft()
+                self._frame_bytes -= len(dropped)
+            return data
+
+    def ack(self, seq_no):
+        """Handle an AudioAdded message: frames up to `seq_no` of this session reached the server"""
+        with self._lock:
+            if 0 < seq_no <= len(self._session_frames):
+                self._acked = max(self._acked, self._session_frames[seq_no - 1])
+                self._release()
+
+    def finalised(self, stream_seconds):
+        """Final transcripts now cover the stream up to `stream_seconds`"""
+        with self._lock:
+            self._final = max(self._final, int(stream_seconds * self.bytes_per_second))
+            self._release()
+
+    def _release(self):
+        done = min(self._acked, self._final)
+        while self._frames and self._frames[0][0] + len(self._frames[0][1]) <= done:
+            _, data = self._frames.popleft()
+            self._frame_bytes -= len(data)
+
+    def new_session(self):
+        """
+        Prepare for a new connection: queue the kept frames for resending and
+        return the stream time in seconds at which the new session starts.
+        """
+        with self._lock:
+            self._session += 1
+            self._session_frames = []
+            self._replay = deque(self._frames)
+            start = self._frames[0][0] if self._frames else self._offset
+            # Audio pushed out of the replay window before it was finalised is never transcribed
+            self.lost_bytes += max(0, start - max(self._final, self._lost_until))
+            self._lost_until = start
+            self.replayed_bytes += self._frame_bytes
+            return start / self.bytes_per_second
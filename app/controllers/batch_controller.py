@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import speechmatics
+from speechmatics.models import AudioSettings, ServerMessageType, TranscriptionConfig
+from ..models.transcription_model import stream_store
+from ..models.translation_model import TranslationModel
+from ..models.subtitles import FORMATS
+from ..models import openai_client
+from ..config import Config
+from .segmenter import Segmenter
+from .translation_pool import TranslationPool
+from .transcription_controller import TranscriptionController
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.aac', '.ogg', '.opus', '.webm', '.mp4')
+STATE_FILE = 'batch_state.json'
+
+
+class _FileJob:
+    """Segments of one recording on their way through the translation pool, matched to results by seq"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._segments = {}  # seq -> Segment
+        self._translations = {}  # seq -> translations; may arrive before submitted() has recorded the seq
+
+    def submitted(self, seq, segment):
+        with self._cond:
+            self._segments[seq] = segment
+
+    def commit(self, text, translations, trace=None, seq=None):
+        with self._cond:
+            self._translations[seq] = translations
+            self._cond.notify_all()
+
+    def wait(self, timeout):
+        """Whether every submitted segment was committed within `timeout` seconds"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._segments.keys() <= self._translations.keys(), timeout)
+
+    @property
+    def cues(self):
+        """(segment, translations) in speech order"""
+        with self._cond:
+            return [(self._segments[seq], self._translations[seq]) for seq in sorted(self._segments)]
+
+
+class BatchTranscriber:
+    """
+    Transcribes and translates recorded files after an event.
+
+    Every file gets its own Speechmatics session, which reads the file directly:
+    the client sends audio as fast as the server acknowledges it instead of at
+    microphone pace, and the server decodes the container format. Up to
+    `sessions` files run at once. Their segments share one translation pool,
+    with one lane per file, so they are translated in batches like live
+    captions. A finished file is written to the store and to subtitle files,
+    then recorded in batch_state.json in the output directory. A rerun skips
+    the files recorded there, unless they have changed since.
+    """
+
+    def __init__(self, input_dir, output_dir, stream_id=None, sessions=None, formats=('srt', 'vtt')):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.sessions = sessions or Config.BATCH_MAX_SESSIONS
+        self.formats = formats
+        self.store = stream_store(stream_id or Config.BATCH_STREAM)
+        if self.store is None:
+            raise ValueError(f"Invalid stream id '{stream_id}'")
+        # No speculation offline: the pool workers are the only callers
+        self.translation_model = TranslationModel(workers=Config.BATCH_TRANSLATION_WORKERS, speculations=0)
+        self.translation_pool = TranslationPool(
+            workers=Config.BATCH_TRANSLATION_WORKERS,
+            max_pending=Config.BATCH_TRANSLATION_MAX_PENDING,
+            policy='block',  # Every segment of a recording must be translated
+            max_batch=Config.TRANSLATION_MAX_BATCH,
+            max_wait=Config.TRANSLATION_BATCH_MAX_WAIT
+        )
+        self._state_file = os.path.join(output_dir, STATE_FILE)
+        self._state_lock = threading.Lock()
+        self._print_lock = threading.Lock()
+        self.state = self._load_state()
+
+        Config.validate()
+
+    def _load_state(self):
+        try:
+            with open(self._state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'files': {}}
+
+    def _record(self, name, entry):
+        """Record a finished file; the state file is replaced atomically so an interrupted run can't corrupt it"""
+        with self._state_lock:
+            self.state['files'][name] = entry
+            tmp_file = f"{self._state_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self._state_file)
+
+    def find_files(self):
+        """Audio files under the input directory, as paths relative to it"""
+        names = []
+        for root, _, files in os.walk(self.input_dir):
+            for file in files:
+                if file.lower().endswith(AUDIO_EXTENSIONS):
+                    names.append(os.path.relpath(os.path.join(root, file), self.input_dir))
+        return sorted(names)
+
+    def _fingerprint(self, name):
+        stat = os.stat(os.path.join(self.input_dir, name))
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def is_done(self, name):
+        entry = self.state['files'].get(name)
+        return bool(entry) and entry.get('status') == 'done' and all(
+            entry.get(key) == value for key, value in self._fingerprint(name).items()
+        )
+
+    def run(self):
+        """Process every file not finished by an earlier run; returns {'done': n, 'skipped': n, 'failed': n}"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        names = self.find_files()
+        todo = [name for name in names if not self.is_done(name)]
+        summary = {'done': 0, 'skipped': len(names) - len(todo), 'failed': 0}
+        print(f"{len(todo)} of {len(names)} files to process, {self.sessions} at a time")
+        if not todo:
+            return summary
+
+        self.translation_pool.start()
+        openai_client.warm_up(min(self.sessions, Config.OPENAI_WARMUP_CONNECTIONS))
+        try:
+            with ThreadPoolExecutor(max_workers=self.sessions, thread_name_prefix="batch-session") as executor:
+                futures = {executor.submit(self._process, name): name for name in todo}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        segments, elapsed = future.result()
+                        summary['done'] += 1
+                        self._print(f"Done: {name} ({segments} segments in {elapsed:.1f}s)")
+                    except Exception as e:
+                        summary['failed'] += 1
+                        self._record(name, {'status': 'failed', 'error': str(e), **self._fingerprint(name)})
+                        self._print(f"Failed: {name}: {e}")
+        finally:
+            self.translation_pool.stop(timeout=30)
+        return summary
+
+    def _print(self, message):
+        with self._print_lock:
+            print(message)
+
+    def _process(self, name):
+        """Transcribe, translate and write out one file; returns (segments, seconds taken)"""
+        started = time.monotonic()
+        job = _FileJob()
+        self.translation_pool.add_lane(name, self.translation_model.translate_batch, job.commit)
+        try:
+            return self._transcribe(name, job, started)
+        finally:
+            self.translation_pool.remove_lane(name)
+
+    def _transcribe(self, name, job, started):
+        """Run the file's Speechmatics session, wait for its translations and write the outputs"""
+        segmenter = Segmenter(
+            max_words=Config.SEGMENT_MAX_WORDS,
+            max_duration=Config.SEGMENT_MAX_DURATION,
+            pause_threshold=Config.SEGMENT_PAUSE_THRESHOLD
+        )
+
+        def submit(segment):
+            job.submitted(self.translation_pool.submit(segment.text, lane=name), segment)
+
+        def handle_final_transcript(msg):
+            for segment in segmenter.feed(msg):
+                submit(segment)
+
+        ws = speechmatics.client.WebsocketClient(TranscriptionController.connection_settings())
+        ws.add_event_handler(event_name=ServerMessageType.AddTranscript, event_handler=handle_final_transcript)
+        config = TranscriptionConfig(
+            language=Config.SOURCE_LANGUAGE,
+            max_delay=Config.BATCH_MAX_DELAY,
+            operating_point="enhanced"
+        )
+        # No encoding: the file is sent as is and decoded by the server
+        settings = AudioSettings(chunk_size=Config.SEND_CHUNK_SIZE)
+        with open(os.path.join(self.input_dir, name), 'rb') as audio:
+            ws.run_synchronously(audio, config, settings)
+
+        segment = segmenter.flush()
+        if segment:
+            submit(segment)
+        if not job.wait(Config.BATCH_TRANSLATION_TIMEOUT):
+            raise TimeoutError(f"translations not finished within {Config.BATCH_TRANSLATION_TIMEOUT:.0f}s")
+
+        cues = job.cues
+        self._write_outputs(name, cues)
+        self._record(name, {
+            'status': 'done',
+            'segments': len(cues),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **self._fingerprint(name)
+        })
+        return len(cues), time.monotonic() - started
+
+    def _write_outputs(self, name, cues):
+        """Save the captions of a finished file to the store and to one subtitle file per language and format"""
+        for segment, translations in cues:
+            self.store.save_transcription(segment.text, TranslationModel.for_display(translations))
+
+        base = os.path.join(self.output_dir, os.path.splitext(name)[0])
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        for lang in [Config.SOURCE_LANGUAGE] + Config.TARGET_LANGUAGES:
+            lines = [
+                (
+                    segment.start_time,
+                    segment.end_time,
+                    segment.text if lang == Config.SOURCE_LANGUAGE else TranslationModel.for_display(translations)[lang]
+                )
+                for segment, translations in cues
+            ]
+            for fmt in self.formats:
+                with open(f"{base}.{lang}.{fmt}", 'w', encoding='utf-8') as f:
+                    f.write(FORMATS[fmt](lines))
@@ -0,0 +1,261 @@
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from ..config import Config
+from ..models.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LATENCY_ADJUSTMENTS = registry.counter(
+    'caption_latency_adjustments_total', "Pipeline settings changed by the latency controller",
+    labels=('setting', 'direction')
+)
+
+# Running controllers by name, for the /api/latency endpoint
+latency_controllers = {}
+
+# Change per adjustment
+WORDS_STEP = 2
+DURATION_STEP = 1.0
+MAX_DELAY_STEP = 0.5
+
+
+class LatencyController:
+    """
+    Holds the caption delay near LATENCY_TARGET by retuning the pipeline while it runs.
+
+    The caption delay of a segment is the time from its first word being
+    spoken until its caption is saved. Every LATENCY_CHECK_INTERVAL seconds the
+    median over recent segments is compared with the target. Above it, one
+    setting is moved towards lower latency, picked by where the time went: a
+    translation backlog raises the batch size and then switches to the fast
+    model, slow translations switch to the fast model, long segments are cut
+    shorter and a slow transcript lowers Speechmatics' max_delay. Below it,
+    settings go back towards their configured values, the model first.
+
+    One controller serves one translation pool and every stream attached to
+    it. After a change the samples are discarded, so the next decision only
+    sees segments produced with the new settings.
+    """
+
+    def __init__(self, name, translation_pool, translation_model):
+        self.name = name
+        self.translation_pool = translation_pool
+        self.translation_model = translation_model
+        self.streams = []
+        self.target = Config.LATENCY_TARGET
+        self.defaults = {
+            'segment_max_words': Config.SEGMENT_MAX_WORDS,
+            'segment_max_duration': Config.SEGMENT_MAX_DURATION,
+            'max_delay': Config.SPEECHMATICS_MAX_DELAY,
+            'max_batch': translation_pool.max_batch,
+            'model': translation_model.model,
+        }
+        self.settings = dict(self.defaults)
+        self.adjustments = deque(maxlen=Config.LATENCY_HISTORY)
+        self._samples = deque(maxlen=Config.LATENCY_WINDOW)  # {stage: seconds} with 'delay'
+        self._lock = threading.Lock()
+        self._model_since = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._register_metrics()
+
+    def attach(self, stream):
+        """Let the controller tune a TranscriptionController's segmenter and Speechmatics session"""
+        with self._lock:
+            self.streams.append(stream)
+        stream.segmenter.max_words = self.settings['segment_max_words']
+        stream.segmenter.max_duration = self.settings['segment_max_duration']
+        stream.set_max_delay(self.settings['max_delay'])
+
+    def observe(self, trace):
+        """Record the stage timings of a saved segment; segments without a capture time are ignored"""
+        durations = trace.durations()
+        if 'latency' not in durations:
+            return
+        durations['delay'] = durations['latency'] + durations.get('segment', 0.0)
+        with self._lock:
+            self._samples.append(durations)
+
+    def measured(self):
+        """Median caption delay and stage timings of the recent segments, and the current backlog"""
+        with self._lock:
+            samples = list(self._samples)
+        measured = {
+            stage: statistics.median(sample.get(stage, 0.0) for sample in samples) if samples else None
+            for stage in ('delay', 'segment', 'transcription', 'queue', 'translation')
+        }
+        measured['samples'] = len(samples)
+        measured['queue_depth'] = self.translation_pool.pending
+        return measured
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        latency_controllers[self.name] = self
+        self._thread = threading.Thread(target=self._run, name=f"latency-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self._thread = None
+        latency_controllers.pop(self.name, None)
+
+    def _run(self):
+        while not self._stop.wait(Config.LATENCY_CHECK_INTERVAL):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Latency control error: %s", e)
+
+    def check(self):
+        """Make one decision; returns the adjustments made"""
+        measured = self.measured()
+        if measured['samples'] < Config.LATENCY_MIN_SAMPLES:
+            return []
+        delay = measured['delay']
+        backlog = measured['queue_depth'] >= self.translation_pool.workers
+        if delay > self.target * (1 + Config.LATENCY_TOLERANCE):
+            changes = self._speed_up(measured, backlog)
+        elif delay < self.target * (1 - Config.LATENCY_TOLERANCE) and not backlog:
+            changes = self._relax(measured)
+        else:
+            changes = []
+
+        made = [self._apply(setting, value, reason, measured) for setting, value, reason in changes]
+        if made:
+            with self._lock:
+                self._samples.clear()
+        return made
+
+    def _speed_up(self, measured, backlog):
+        """The changes that take the most likely cause of the excess delay away, within the bounds"""
+        settings = self.settings
+        fast_model = Config.LATENCY_FAST_MODEL
+        can_switch = bool(fast_model) and settings['model'] != fast_model
+        can_batch = settings['max_batch'] < Config.LATENCY_MAX_BATCH
+        can_cut = settings['segment_max_words'] > Config.LATENCY_MIN_SEGMENT_WORDS
+        can_lower_delay = settings['max_delay'] > Config.LATENCY_MIN_MAX_DELAY
+
+        if backlog and can_batch:
+            return [('max_batch', settings['max_batch'] + 1, "translation backlog")]
+        if backlog and can_switch:
+            return [('model', fast_model, "translation backlog")]
+        if measured['translation'] > self.target * Config.LATENCY_TRANSLATION_SHARE and can_switch:
+            return [('model', fast_model, "slow translations")]
+        if can_cut and (measured['segment'] >= measured['transcription'] or not can_lower_delay):
+            return self._segment_changes(-1, "long segments")
+        if can_lower_delay:
+            return [('max_delay', max(settings['max_delay'] - MAX_DELAY_STEP, Config.LATENCY_MIN_MAX_DELAY),
+                     "slow transcript")]
+        if can_switch:
+            return [('model', fast_model, "no other setting left")]
+        return []
+
+    def _relax(self, measured):
+        """Move one setting back towards its configured value, the one that costs most quality first"""
+        settings, defaults = self.settings, self.defaults
+        if settings['model'] != defaults['model'] and time.monotonic() - self._model_since >= Config.LATENCY_MODEL_HOLD:
+            return [('model', defaults['model'], "headroom")]
+        if settings['max_delay'] < defaults['max_delay']:
+            return [('max_delay', min(settings['max_delay'] + MAX_DELAY_STEP, defaults['max_delay']), "headroom")]
+        if settings['segment_max_words'] < defaults['segment_max_words']:
+            return self._segment_changes(1, "headroom")
+        if settings['max_batch'] > defaults['max_batch'] and not measured['queue_depth']:
+            return [('max_batch', settings['max_batch'] - 1, "headroom")]
+        return []
+
+    def _segment_changes(self, direction, reason):
+        """Shorten (-1) or lengthen (1) segments by one step, keeping both limits between bound and default"""
+        settings, defaults = self.settings, self.defaults
+        words = settings['segment_max_words'] + direction * WORDS_STEP
+        duration = settings['segment_max_duration'] + direction * DURATION_STEP
+        words = max(Config.LATENCY_MIN_SEGMENT_WORDS, min(words, defaults['segment_max_words']))
+        duration = max(Config.LATENCY_MIN_SEGMENT_DURATION, min(duration, defaults['segment_max_duration']))
+        return [
+            (setting, value, reason)
+            for setting, value in (('segment_max_words', words), ('segment_max_duration', duration))
+            if value != settings[setting]
+        ]
+
+    def _apply(self, setting, value, reason, measured):
+        old = self.settings[setting]
+        self.settings[setting] = value
+        if setting == 'model':
+            self.translation_model.model = value
+            self._model_since = time.monotonic()
+            direction = 'down' if value != self.defaults['model'] else 'up'
+        else:
+            direction = 'up' if value > old else 'down'
+            if setting == 'max_batch':
+                self.translation_pool.max_batch = value
+            else:
+                with self._lock:
+                    streams = list(self.streams)
+                for stream in streams:
+                    if setting == 'max_delay':
+                        stream.set_max_delay(value)
+                    else:
+                        setattr(stream.segmenter, setting[len('segment_'):], value)
+
+        adjustment = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'setting': setting,
+            'old': old,
+            'new': value,
+            'reason': reason,
+            'delay': round(measured['delay'], 3),
+            'queue_depth': measured['queue_depth'],
+        }
+        self.adjustments.append(adjustment)
+        LATENCY_ADJUSTMENTS.inc(setting=setting, direction=direction)
+        logger.info("Caption delay %.2fs (target %.2fs): %s %s -> %s (%s)",
+                    measured['delay'], self.target, setting, old, value, reason,
+                    extra={'controller': self.name, **adjustment})
+        return adjustment
+
+    def state(self):
+        """Everything /api/latency shows: target, bounds, current settings, measurements and recent changes"""
+        measured = self.measured()
+        return {
+            'target': self.target,
+            'tolerance': Config.LATENCY_TOLERANCE,
+            'settings': dict(self.settings),
+            'defaults': dict(self.defaults),
+            'bounds': {
+                'segment_max_words': Config.LATENCY_MIN_SEGMENT_WORDS,
+                'segment_max_duration': Config.LATENCY_MIN_SEGMENT_DURATION,
+                'max_delay': Config.LATENCY_MIN_MAX_DELAY,
+                'max_batch': Config.LATENCY_MAX_BATCH,
+                'model': Config.LATENCY_FAST_MODEL,
+            },
+            'measured': {
+                key: round(value, 3) if isinstance(value, float) else value for key, value in measured.items()
+            },
+            'adjustments': list(self.adjustments),
+        }
+
+    def _register_metrics(self):
+        """Expose the current settings; read only when /metrics is scraped"""
+        name = self.name
+
+        def settings():
+            values = {(name, setting): value for setting, value in self.settings.items() if setting != 'model'}
+            values[(name, 'fast_model')] = int(self.settings['model'] != self.defaults['model'])
+            return values
+
+        registry.gauge(
+            'caption_latency_control_setting', "Settings chosen by the latency controller; fast_model is 1 under load",
+            labels=('controller', 'setting'), source=name, fn=settings
+        )
+        registry.gauge(
+            'caption_latency_control_delay_seconds', "Median caption delay the latency controller is steering",
+            labels=('controller',), source=name,
+            fn=lambda: {(name,): self.measured()['delay'] or 0.0}
+        )
@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+SENTENCE_END = ('.', '!', '?', '؟')
+
+
+@dataclass
+class Segment:
+    """A span of final transcript that is translated as one caption"""
+    text: str
+    start_time: float
+    end_time: float
+    word_count: int
+
+
+class Segmenter:
+    """
+    Cuts the final transcript into translation segments as AddTranscript messages arrive.
+
+    Works from the structured `results` array rather than the flat transcript
+    string: a segment ends after sentence-ending punctuation, before a word
+    that follows a pause of at least `pause_threshold` seconds, or once it
+    reaches `max_words` words or `max_duration` seconds. Messages without
+    words still carry the transcript's end time, so a pause also ends the
+    segment as soon as one shows the silence, not only when the next word
+    arrives. The word count is kept as words arrive, so no message re-scans
+    the buffered text.
+
+    A segment that reaches a limit on the last word of a message is returned
+    with the next message, so punctuation finalised at the start of that
+    message still ends up on the segment it belongs to.
+    """
+
+    def __init__(self, max_words=10, max_duration=6.0, pause_threshold=0.8):
+        self.max_words = max_words
+        self.max_duration = max_duration
+        self.pause_threshold = pause_threshold
+        self._held = None  # Segment cut at a limit, waiting for trailing punctuation in the next message
+        self._reset()
+
+    def _reset(self):
+        self._tokens = []
+        self._word_count = 0
+        self._start_time = None
+        self._end_time = None
+        self._limit_reached = False
+
+    @property
+    def text(self):
+        """Text buffered for the segment that is still open"""
+        return " ".join(self._tokens)
+
+    @property
+    def word_count(self):
+        return self._word_count
+
+    def would_end(self, text):
+        """Whether a segment with this text would be cut by the punctuation or word rules"""
+        return text.endswith(SENTENCE_END) or len(text.split()) >= self.max_words
+
+    def feed(self, msg) -> List[Segment]:
+        """Add an AddTranscript message and return the segments it completes"""
+        segments = []
+        results = self._results(msg)
+        if self._held is not None:
+            held, self._held = self._held, None
+            while results and results[0].get('type') == 'punctuation':
+                held.text += results[0]['alternatives'][0]['content']
+                held.end_time = max(held.end_time, results[0].get('end_time', held.end_time))
+                results = results[1:]
+            segments.append(held)
+
+        for result in results:
+            content = result['alternatives'][0]['content']
+            if result.get('type') == 'punctuation':
+                if not self._tokens:
+                    continue
+                self._tokens[-1] += content
+                self._end_time = max(self._end_time, result.get('end_time', self._end_time))
+                if result.get('is_eos') or content in SENTENCE_END:
+                    segments.append(self._cut())
+                continue
+
+            start_time = result.get('start_time', 0.0)
+            if self._tokens and (self._limit_reached or start_time - self._end_time >= self.pause_threshold):
+                segments.append(self._cut())
+            self._add_word(content, start_time, result.get('end_time', start_time))
+            if content.endswith(SENTENCE_END):
+                segments.append(self._cut())
+
+        # Messages keep arriving through silence: once the transcript has moved a pause past the last
+        # word without a new one, the open segment is complete rather than waiting for the next word
+        end_time = msg.get('metadata', {}).get('end_time')
+        if (self._tokens and end_time is not None and not any(r.get('type') != 'punctuation' for r in results)
+                and end_time - self._end_time >= self.pause_threshold):
+            segments.append(self._cut())
+
+        # A limit reached on the last word only waited for trailing punctuation, which may come next
+        if self._limit_reached:
+            self._held = self._cut()
+        return segments
+
+    def flush(self) -> Optional[Segment]:
+        """Return whatever is buffered as a final segment"""
+        if self._held is not None:
+            held, self._held = self._held, None
+            return held
+        if not self._tokens:
+            return None
+        return self._cut()
+
+    def _add_word(self, content, start_time, end_time):
+        if self._start_time is None:
+            self._start_time = start_time
+        self._tokens.append(content)
+        self._word_count += 1
+        self._end_time = end_time
+        if self._word_count >= self.max_words or end_time - self._start_time >= self.max_duration:
+            self._limit_reached = True
+
+    def _cut(self):
+        segment = Segment(
+            text=self.text,
+            start_time=self._start_time,
+            end_time=self._end_time,
+            word_count=self._word_count
+        )
+        self._reset()
+        return segment
+
+    @staticmethod
+    def _results(msg):
+        results = msg.get('results')
+        if results:
+            return results
+        # Older messages without a results array: treat the transcript as untimed words
+        metadata = msg.get('metadata', {})
+        start_time = metadata.get('start_time', 0.0)
+        end_time = metadata.get('end_time', start_time)
+        return [
+            {'type': 'word', 'start_time': start_time, 'end_time': end_time, 'alternatives': [{'content': word}]}
+            for word in metadata.get('transcript', '').split()
+        ]
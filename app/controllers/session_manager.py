@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ..models.translation_model import TranslationModel
+from ..models.translation_cache import TranslationCache
+from ..models import openai_client
+from ..config import Config
+from .translation_pool import TranslationPool
+from .transcription_controller import TranscriptionController
+from .latency_controller import LatencyController
+
+
+class SessionManager:
+    """
+    Runs several capture -> transcribe pipelines (rooms, speakers) in one process.
+
+    Each stream has its own audio input, Speechmatics connection, segmenter
+    and store under data/streams/<stream id>/. All streams share one
+    translation model (so one OpenAI client and one translation cache) and
+    one translation pool, in which every stream has its own lane. The pool's
+    workers take turns between lanes, so a busy stream cannot hold every
+    worker while the others wait.
+    """
+
+    def __init__(self, streams=None):
+        streams = self.parse_streams(Config.STREAMS) if streams is None else streams
+        speculations = Config.SPECULATION_MAX_IN_FLIGHT if Config.SPECULATIVE_TRANSLATION else 0
+        # Every stream has its own speculative translator on the shared model
+        self.translation_model = TranslationModel(
+            workers=Config.TRANSLATION_WORKERS, speculations=speculations * max(1, len(streams))
+        )
+        self.translation_pool = TranslationPool(
+            workers=Config.TRANSLATION_WORKERS,
+            max_pending=Config.TRANSLATION_MAX_PENDING,
+            policy=Config.TRANSLATION_QUEUE_POLICY,
+            max_merge_words=Config.TRANSLATION_MERGE_MAX_WORDS,
+            max_batch=Config.TRANSLATION_MAX_BATCH,
+            max_wait=Config.TRANSLATION_BATCH_MAX_WAIT
+        )
+        self.latency_controller = None
+        if Config.LATENCY_CONTROL:
+            # One controller for the shared pool; it tunes every stream from their combined caption delay
+            self.latency_controller = LatencyController('streams', self.translation_pool, self.translation_model)
+        self.controllers = OrderedDict()
+        self.running = False
+        for stream_id, input_device_index in streams.items():
+            self.add_stream(stream_id, input_device_index)
+
+    @staticmethod
+    def parse_streams(spec):
+        """Parse "id[=device],..." into {stream id: input device index or None}"""
+        streams = OrderedDict()
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            stream_id, _, device = item.partition('=')
+            streams[stream_id.strip()] = int(device) if device.strip() else None
+        return streams
+
+    def add_stream(self, stream_id, input_device_index=None, capture_audio=True):
+        """Create the pipeline for one stream; it starts right away if the manager is running"""
+        if stream_id in self.controllers:
+            raise ValueError(f"Stream '{stream_id}' already exists")
+        controller = TranscriptionController(
+            capture_audio=capture_audio,
+            stream_id=stream_id,
+            translation_model=self.translation_model,
+            translation_pool=self.translation_pool,
+            input_device_index=input_device_index,
+            latency_controller=self.latency_controller
+        )
+        self.controllers[stream_id] = controller
+        if self.running:
+            controller.start()
+        return controller
+
+    def get(self, stream_id):
+        return self.controllers.get(stream_id)
+
+    def start(self):
+        if self.running:
+            return
+        self.warm_up()
+        self.running = True
+        self.translation_pool.start()
+        if self.latency_controller:
+            self.latency_controller.start()
+        if Config.TRANSLATION_CACHE_WARMUP_FILE:
+            threading.Thread(target=self._warm_up_cache, daemon=True).start()
+        for controller in self.controllers.values():
+            controller.start()
+
+    def warm_up(self):
+        """Warm up every stream and the shared OpenAI client at the same time, rather than one after another"""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.controllers) + 1, thread_name_prefix="warm-up") as executor:
+            futures = [executor.submit(openai_client.warm_up, Config.OPENAI_WARMUP_CONNECTIONS)]
+            futures += [executor.submit(controller.warm_up) for controller in self.controllers.values()]
+            for future in futures:
+                future.result()
+        print(f"{len(self.controllers)} streams warmed up in {time.monotonic() - started:.2f}s")
+
+    def stop(self):
+        """Stop every stream, then let the shared pool finish their last segments"""
+        if not self.running:
+            return
+        self.running = False
+        for controller in self.controllers.values():
+            controller.stop()
+        if self.latency_controller:
+            self.latency_controller.stop()
+        self.translation_pool.stop(timeout=10)
+
+    def _warm_up_cache(self):
+        """Preload the shared translation cache with the configured phrase list"""
+        try:
+            phrases = TranslationCache.load_phrases(Config.TRANSLATION_CACHE_WARMUP_FILE)
+            cached = self.translation_model.warm_up_cache(phrases)
+            print(f"Translation cache warmed up: {cached}/{len(phrases)} phrases")
+        except Exception as e:
+            print(f"Translation cache warm-up error: {e}")
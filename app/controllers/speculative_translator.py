@@ -0,0 +1,144 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeTranslator:
+    """
+    Translates stable prefixes of partial transcripts before Speechmatics finalises them.
+
+    A prefix is stable once it has been unchanged over `stable_partials`
+    consecutive AddPartialTranscript messages. Only prefixes that would end
+    a segment (see `is_segment_end`) are speculated on, and at most
+    `max_in_flight` requests run at once, so the number of extra GPT calls
+    stays small. When the final segment arrives, take() reuses a matching
+    speculation, extends a speculated prefix with a translation of the
+    remaining words, or reports a miss so the caller translates normally.
+    Call claim() when a segment is flushed and take() from the worker that
+    translates it.
+    """
+
+    def __init__(self, translate, is_segment_end, stable_partials=2, min_words=4, max_in_flight=2):
+        self.translate = translate
+        self.is_segment_end = is_segment_end
+        self.stable_partials = stable_partials
+        self.min_words = min_words
+        self.max_in_flight = max_in_flight
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="speculation")
+        self._history = deque(maxlen=stable_partials)
+        self._speculations = OrderedDict()  # source words (tuple) -> future
+        self._claimed = OrderedDict()  # flushed segment words -> (exact future, prefix words, prefix future)
+        self.max_claimed = 16
+        self.stats = {'started': 0, 'hits': 0, 'extended': 0, 'misses': 0, 'cancelled': 0, 'wasted': 0}
+
+    def on_partial(self, buffered_text, partial_text):
+        """Feed the already-final text of the open segment and the latest partial transcript"""
+        with self._lock:
+            self._history.append(partial_text.split())
+            if len(self._history) < self.stable_partials:
+                return
+            stable = self._common_prefix(self._history)
+            words = tuple(buffered_text.split() + stable)
+            if len(words) < self.min_words or words in self._speculations:
+                return
+            if not self.is_segment_end(" ".join(words)):
+                return
+            if sum(1 for f in self._speculations.values() if not f.done()) >= self.max_in_flight:
+                return
+            self._speculations[words] = self._executor.submit(self.translate, " ".join(words))
+            self.stats['started'] += 1
+
+    def on_final(self):
+        """Partials restart after every final transcript"""
+        with self._lock:
+            self._history.clear()
+
+    def claim(self, text):
+        """
+        Called when a segment is flushed, before partials for the next one arrive.
+        Keeps the speculations that can serve this segment and cancels the rest.
+        """
+        words = tuple(text.split())
+        with self._lock:
+            speculations, self._speculations = self._speculations, OrderedDict()
+            self._history.clear()
+
+            exact = speculations.pop(words, None)
+            prefix = max(
+                (w for w in speculations if len(w) < len(words) and words[:len(w)] == w),
+                key=len, default=None
+            )
+            head = speculations.pop(prefix) if prefix is not None else None
+            for future in speculations.values():
+                self._discard(future)
+
+            if exact is not None or head is not None:
+                self._claimed[words] = (exact, prefix, head)
+                while len(self._claimed) > self.max_claimed:
+                    _, stale = self._claimed.popitem(last=False)
+                    for future in (stale[0], stale[2]):
+                        if future is not None:
+                            self._discard(future)
+
+    def take(self, text):
+        """
+        Return translations for a finalised segment built from speculative work,
+        or None if nothing usable was speculated
+        """
+        words = tuple(text.split())
+        with self._lock:
+            exact, prefix, head = self._claimed.pop(words, (None, None, None))
+
+        result = None
+        outcome = 'misses'
+        if exact is not None:
+            result = self._usable(exact.result())
+            if result is not None:
+                outcome = 'hits'
+        if result is None and head is not None:
+            head_result = self._usable(head.result())
+            if head_result is not None:
+                tail = self._usable(self.translate(" ".join(words[len(prefix):])))
+                # A failed tail would put its placeholder on air mid-caption; the caller translates it whole instead
+                if tail is not None and tail.keys() >= head_result.keys():
+                    result = {lang: f"{head_result[lang]} {tail[lang]}".strip() for lang in head_result}
+                    outcome = 'extended'
+
+        with self._lock:
+            self.stats[outcome] += 1
+            if exact is not None and outcome != 'hits':
+                self.stats['wasted'] += 1
+            if head is not None and outcome != 'extended':
+                self._discard(head)
+        return result
+
+    def _discard(self, future):
+        # Caller holds self._lock
+        if future.cancel():
+            self.stats['cancelled'] += 1
+        else:
+            self.stats['wasted'] += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        logger.info("Speculative translation stats: %s", self.stats)
+
+    @staticmethod
+    def _common_prefix(word_lists):
+        prefix = []
+        for words in zip(*word_lists):
+            if any(w != words[0] for w in words):
+                break
+            prefix.append(words[0])
+        return prefix
+
+    @staticmethod
+    def _usable(translations):
+        if any(value.startswith(('<Error', '<Missing')) for value in translations.values()):
+            return None
+        return translations
@@ -1,58 +1,235 @@
-import speechmatics
-from speechmatics.models import (
-    ConnectionSettings,
-    TranscriptionConfig,
-    AudioSettings,
-    ServerMessageType
-)
-import pyaudio
+import logging
+import socket
 import threading
-import queue
 import time
-from ..models.transcription_model import TranscriptionModel
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from ..models.transcription_model import default_store, stream_store
 from ..models.translation_model import TranslationModel
+from ..models import openai_client
+from ..models.translation_cache import TranslationCache
+from ..models.metrics import SEGMENTS, SegmentTrace, registry, tracer
 from ..config import Config
+from .translation_pool import TranslationPool
+from .speculative_translator import SpeculativeTranslator
+from .segmenter import Segmenter
+from .latency_controller import LatencyController
+from .audio_stream import AudioRingBuffer, ReplayableAudioStream, VoiceActivityGate
+
+# One structured record per committed segment (stream, id, size, stage timings)
+segment_logger = logging.getLogger(__name__ + '.segments')
+
 
 class TranscriptionController:
-    def __init__(self):
-        self.model = TranscriptionModel()
-        self.translation_model = TranslationModel()
-        self.audio_queue = queue.Queue()
-        self.transcript_buffer = ""
+    def __init__(self, capture_audio=True, stream_id=None, translation_model=None, translation_pool=None,
+                 input_device_index=None, latency_controller=None):
+        """
+        With a `stream_id` the controller is one of several audio streams: it
+        stores under data/streams/<stream_id>/ and, given a shared
+        `translation_model` and `translation_pool`, translates through a lane
+        of that pool instead of owning one, tuned by the pool's `latency_controller`.
+        """
+        self.stream_id = stream_id
+        self.input_device_index = input_device_index
+        self.model = stream_store(stream_id) if stream_id else default_store()
+        if self.model is None:
+            raise ValueError(f"Invalid stream id '{stream_id}'")
+        self.translation_model = translation_model or TranslationModel()
+        self.audio_buffer = AudioRingBuffer(
+            bytes_per_second=Config.SAMPLE_RATE * Config.CHANNELS * 2,
+            max_lag=Config.AUDIO_MAX_LAG
+        )
+        # What the websocket reads; keeps unconfirmed audio for resending after a reconnect
+        self.audio_stream = ReplayableAudioStream(
+            self.audio_buffer,
+            bytes_per_second=Config.SAMPLE_RATE * Config.CHANNELS * 2,
+            max_replay=Config.RECONNECT_REPLAY_SECONDS
+        )
+        self._session_offset = 0.0  # Stream time at which the current Speechmatics session started
+        self._final_until = 0.0  # Stream time covered by final transcripts
+        self._resumed_at = 0.0  # Final stream time when the current session started; replayed words before it are repeats
+        self.segmenter = Segmenter(
+            max_words=Config.SEGMENT_MAX_WORDS,
+            max_duration=Config.SEGMENT_MAX_DURATION,
+            pause_threshold=Config.SEGMENT_PAUSE_THRESHOLD
+        )
+        self.max_delay = Config.SPEECHMATICS_MAX_DELAY
         self.print_lock = threading.Lock()
+        self.vad_gate = None
+        if Config.VAD_ENABLED:
+            self.vad_gate = VoiceActivityGate(
+                sample_rate=Config.SAMPLE_RATE,
+                threshold_db=Config.VAD_THRESHOLD_DB,
+                hangover=Config.VAD_HANGOVER,
+                pre_roll=Config.VAD_PRE_ROLL,
+                keepalive_interval=Config.VAD_KEEPALIVE_INTERVAL
+            )
         self.running = False
         self.audio_thread = None
         self.transcription_thread = None
-        
+        self.owns_pool = translation_pool is None
+        if self.owns_pool:
+            self._lane = None
+            self.translation_pool = TranslationPool(
+                translate_batch=self._translate_segments,
+                commit=self._commit_translation,
+                workers=Config.TRANSLATION_WORKERS,
+                max_pending=Config.TRANSLATION_MAX_PENDING,
+                policy=Config.TRANSLATION_QUEUE_POLICY,
+                max_merge_words=Config.TRANSLATION_MERGE_MAX_WORDS,
+                max_batch=Config.TRANSLATION_MAX_BATCH,
+                max_wait=Config.TRANSLATION_BATCH_MAX_WAIT
+            )
+        else:
+            self._lane = stream_id
+            self.translation_pool = translation_pool
+            translation_pool.add_lane(stream_id, self._translate_segments, self._commit_translation)
+        self.speculator = None
+        if Config.SPECULATIVE_TRANSLATION:
+            self.speculator = SpeculativeTranslator(
+                translate=self.translation_model.translate,
+                is_segment_end=self.segmenter.would_end,
+                stable_partials=Config.SPECULATION_STABLE_PARTIALS,
+                min_words=Config.SPECULATION_MIN_WORDS,
+                max_in_flight=Config.SPECULATION_MAX_IN_FLIGHT
+            )
+
+        # Retunes segmentation, max_delay, batching and the model while running; a shared pool brings its own
+        if latency_controller is None and self.owns_pool and Config.LATENCY_CONTROL:
+            latency_controller = LatencyController(
+                stream_id or 'default', self.translation_pool, self.translation_model
+            )
+        self.latency_controller = latency_controller
+
+        self._register_metrics()
+
         # Validate configuration
         Config.validate()
-        
-        # Initialize Speechmatics client
-        self._init_speechmatics()
-        
-        # Initialize audio capture
-        self._init_audio()
+
+        # The Speechmatics client and the audio device are created by warm_up(), so constructing
+        # a controller neither loads the SDKs nor opens the microphone
+        self.capture_audio = capture_audio
+        self.ws = None
+        self.warmed_up = False
+        if self.latency_controller:
+            self.latency_controller.attach(self)
+
+    def warm_up(self, connect_openai=None):
+        """
+        Get everything ready to go live, in parallel: the Speechmatics client
+        (and its host's DNS entry), the audio device and pooled OpenAI
+        connections. start() does this itself if it hasn't happened yet; calling
+        it earlier takes it off the time to the first caption.
+        """
+        if self.warmed_up:
+            return
+        started = time.monotonic()
+        tasks = [self._init_speechmatics, self._resolve_speechmatics_host]
+        if self.capture_audio and not hasattr(self, 'stream'):
+            tasks.append(self._init_audio)
+        # A shared pool's OpenAI client is warmed up once by its owner
+        if connect_openai is None:
+            connect_openai = self.owns_pool
+        if connect_openai:
+            tasks.append(lambda: openai_client.warm_up(Config.OPENAI_WARMUP_CONNECTIONS))
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warm-up") as executor:
+            for future in [executor.submit(task) for task in tasks]:
+                future.result()
+        self.warmed_up = True
+        with self.print_lock:
+            print(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+
+    @staticmethod
+    def _resolve_speechmatics_host():
+        """Look up the Speechmatics host ahead of time; the SDK opens its websocket only when a session starts"""
+        host = urlparse(Config.SPEECHMATICS_URL).hostname
+        try:
+            socket.getaddrinfo(host, 443)
+        except OSError as e:
+            print(f"Could not resolve {host}: {e}")
 
     def _init_speechmatics(self):
         """Initialize Speechmatics client"""
+        # Imported on first use so nothing that merely imports this module loads the SDK
+        import speechmatics.client
+        from speechmatics.models import ServerMessageType
         try:
-            self.ws = speechmatics.client.WebsocketClient(
-                ConnectionSettings(
-                    url=Config.SPEECHMATICS_URL,
-                    auth_token=Config.SPEECHMATICS_AUTH_TOKEN
-                )
-            )
+            self.ws = speechmatics.client.WebsocketClient(self.connection_settings())
             
             # Register event handler
             self.ws.add_event_handler(
                 event_name=ServerMessageType.AddTranscript,
                 event_handler=self.handle_final_transcript
             )
+            self.ws.add_event_handler(
+                event_name=ServerMessageType.AudioAdded,
+                event_handler=lambda msg: self.audio_stream.ack(msg['seq_no'])
+            )
+            if self.speculator:
+                self.ws.add_event_handler(
+                    event_name=ServerMessageType.AddPartialTranscript,
+                    event_handler=self.handle_partial_transcript
+                )
         except Exception as e:
             raise RuntimeError(f"Failed to initialize Speechmatics client: {e}")
 
-    def _init_audio(self):
-        """Initialize audio capture"""
+    @staticmethod
+    def connection_settings():
+        """Speechmatics ConnectionSettings from Config"""
+        from speechmatics.models import ConnectionSettings
+        settings = ConnectionSettings(
+            url=Config.SPEECHMATICS_URL,
+            auth_token=Config.SPEECHMATICS_AUTH_TOKEN
+        )
+        if Config.SPEECHMATICS_URL.startswith('ws://'):
+            # Plain websockets (e.g. a local test server) refuse an SSL context
+            settings.ssl_context = None
+        return settings
+
+    def _register_metrics(self):
+        """Expose queue depths and component statistics per stream; read only when /metrics is scraped"""
+        stream = self.stream_id or 'default'
+        registry.gauge(
+            'caption_translation_queue_depth', "Segments waiting for a translation worker",
+            labels=('stream',), source=stream,
+            fn=lambda: {(stream,): self.translation_pool.lane_stats(self._lane)[0]}
+        )
+
+        def skipped():
+            _, merged, dropped = self.translation_pool.lane_stats(self._lane)
+            return {(stream, 'merged'): merged, (stream, 'dropped'): dropped}
+
+        registry.counter(
+            'caption_translation_skipped_total', "Segments merged or dropped because the translation backlog was full",
+            labels=('stream', 'reason'), source=stream, fn=skipped
+        )
+        registry.gauge(
+            'caption_audio_lag_seconds', "Captured audio waiting to be sent to Speechmatics",
+            labels=('stream',), source=stream, fn=lambda: {(stream,): self.audio_buffer.lag_seconds}
+        )
+        registry.counter(
+            'caption_audio_dropped_seconds_total', "Audio discarded because the stream fell too far behind",
+            labels=('stream',), source=stream, fn=lambda: {(stream,): self.audio_buffer.dropped_seconds}
+        )
+        cache = self.translation_model.cache
+        if cache is not None:
+            # Shared by every stream that uses the same translation model
+            registry.counter(
+                'caption_translation_cache_lookups_total', "Translation cache lookups by result",
+                labels=('result',),
+                fn=lambda: {('hit',): cache.stats['hits'], ('disk_hit',): cache.stats['disk_hits'],
+                            ('miss',): cache.stats['misses']}
+            )
+        if self.speculator:
+            registry.counter(
+                'caption_speculation_total', "Speculative translation events",
+                labels=('stream', 'event'), source=stream,
+                fn=lambda: {(stream, event): count for event, count in self.speculator.stats.items()}
+            )
+
+    def _init_audio(self, stream_callback=None):
+        """Initialize audio capture; with a stream_callback PyAudio pushes chunks instead of being read"""
+        import pyaudio
         try:
             self.p = pyaudio.PyAudio()
             self.stream = self.p.open(
@@ -60,7 +237,9 @@ class TranscriptionController:
                 channels=Config.CHANNELS,
                 rate=Config.SAMPLE_RATE,
                 input=True,
-                frames_per_buffer=Config.CHUNK_SIZE
+                frames_per_buffer=Config.CHUNK_SIZE,
+                input_device_index=self.input_device_index,
+                stream_callback=stream_callback
             )
         except Exception as e:
             raise RuntimeError(f"Failed to initialize audio capture: {e}")
@@ -70,8 +249,19 @@ class TranscriptionController:
         if self.running:
             return
 
+        self.warm_up()
         self.running = True
+        self.translation_pool.start()  # No-op for a shared pool that is already running
+        if self.owns_pool and self.latency_controller:
+            self.latency_controller.start()
+
+        # A shared translation model is warmed up once by its owner
+        if self.owns_pool and Config.TRANSLATION_CACHE_WARMUP_FILE:
+            threading.Thread(target=self._warm_up_cache, daemon=True).start()
         
+        # Rotate and compact the store in the background, starting with last session's segment
+        threading.Thread(target=self._maintain_store, daemon=True).start()
+
         # Start audio capture thread
         self.audio_thread = threading.Thread(target=self._capture_audio)
         self.audio_thread.daemon = True
@@ -90,7 +280,7 @@ class TranscriptionController:
             return
 
         self.running = False
-        self.audio_queue.put(None)  # Signal audio thread to stop
+        self.audio_buffer.close()  # Signal transcription thread to stop
 
         # Wait for threads to finish
         if self.audio_thread:
@@ -98,6 +288,17 @@ class TranscriptionController:
         if self.transcription_thread:
             self.transcription_thread.join(timeout=2)
 
+        # Translate whatever was said after the last segment boundary
+        segment = self.segmenter.flush()
+        if segment:
+            self._submit_segment(segment)
+        if self.owns_pool:
+            if self.latency_controller:
+                self.latency_controller.stop()
+            self.translation_pool.stop(timeout=10)
+        if self.speculator:
+            self.speculator.shutdown()
+
         # Cleanup resources
         if hasattr(self, 'stream'):
             self.stream.stop_stream()
@@ -107,62 +308,206 @@ class TranscriptionController:
 
         print("Transcription system stopped.")
 
+    def _maintain_store(self):
+        """Archive the live store segment per session and whenever it grows past the configured size or age"""
+        try:
+            if Config.STORE_ROTATE_ON_START:
+                self.model.rotate()
+            while self.running:
+                time.sleep(Config.STORE_ROTATE_CHECK_INTERVAL)
+                if self.running:
+                    self.model.rotate(max_rows=Config.STORE_SEGMENT_MAX_ROWS, max_age=Config.STORE_SEGMENT_MAX_AGE)
+        except Exception as e:
+            print(f"Store rotation error: {e}")
+
+    def _warm_up_cache(self):
+        """Preload the translation cache with the configured phrase list"""
+        try:
+            phrases = TranslationCache.load_phrases(Config.TRANSLATION_CACHE_WARMUP_FILE)
+            cached = self.translation_model.warm_up_cache(phrases)
+            with self.print_lock:
+                print(f"Translation cache warmed up: {cached}/{len(phrases)} phrases")
+        except Exception as e:
+            print(f"Translation cache warm-up error: {e}")
+
+    @property
+    def audio_lag(self):
+        """Seconds of captured audio not yet sent to Speechmatics"""
+        return self.audio_buffer.lag_seconds
+
     def _capture_audio(self):
         """Capture audio from microphone"""
+        reported_drop = 0.0
         try:
             while self.running:
                 try:
                     data = self.stream.read(Config.CHUNK_SIZE, exception_on_overflow=False)
-                    self.audio_queue.put(data)
+                    # Long pauses are reduced to keep-alive silence before they reach the websocket
+                    for chunk in self.vad_gate.process(data) if self.vad_gate else (data,):
+                        self.audio_buffer.write(chunk)
+
+                    dropped = self.audio_buffer.dropped_seconds
+                    if dropped - reported_drop >= 1.0:
+                        reported_drop = dropped
+                        print(f"Audio is {Config.AUDIO_MAX_LAG:.1f}s behind real time; "
+                              f"dropped {dropped:.1f}s of oldest audio so far")
                 except IOError as e:
                     print(f"Audio capture error: {e}")
                     time.sleep(0.1)  # Brief pause before retrying
         except Exception as e:
             print(f"Fatal audio capture error: {e}")
         finally:
-            self.audio_queue.put(None)  # Signal transcription thread to stop
+            self.audio_buffer.close()  # Signal transcription thread to stop
 
-    def _start_transcription(self):
-        """Start the Speechmatics transcription process"""
+    def transcription_settings(self):
+        """Speechmatics (TranscriptionConfig, AudioSettings) for a session"""
+        from speechmatics.models import AudioSettings, TranscriptionConfig
         settings = AudioSettings(
             encoding=Config.FORMAT,
             sample_rate=Config.SAMPLE_RATE,
-            chunk_size=Config.CHUNK_SIZE
+            chunk_size=Config.SEND_CHUNK_SIZE
         )
 
         config = TranscriptionConfig(
             language=Config.SOURCE_LANGUAGE,
-            enable_partials=False,
-            max_delay=2.5,
+            enable_partials=self.speculator is not None,
+            max_delay=self.max_delay,
             operating_point="enhanced"
         )
+        return config, settings
 
-        try:
-            self.ws.run_synchronously(QueueStream(self.audio_queue), config, settings)
-        except Exception as e:
-            print(f"Transcription error: {e}")
+    def set_max_delay(self, max_delay):
+        """Change max_delay; a running session is reconfigured (SetRecognitionConfig) before its next audio"""
+        self.max_delay = max_delay
+        if self.ws is not None and self.ws.transcription_config is not None:
+            self.ws.update_transcription_config(self.transcription_settings()[0])
+
+    def _start_transcription(self):
+        """Run Speechmatics sessions until the audio ends, reconnecting with exponential backoff"""
+        delay = Config.RECONNECT_INITIAL_DELAY
+
+        while self.running:
+            config, settings = self.transcription_settings()  # Picks up a max_delay changed since the last session
+            lost = self.audio_stream.lost_bytes
+            self._session_offset = self.audio_stream.new_session()
+            self._resumed_at = self._final_until
+            if self.audio_stream.lost_bytes > lost:
+                seconds = (self.audio_stream.lost_bytes - lost) / self.audio_stream.bytes_per_second
+                print(f"{seconds:.1f}s of audio could not be resent and will be missing from the transcript")
+
+            started = time.monotonic()
+            try:
+                self.ws.run_synchronously(self.audio_stream, config, settings)
+            except Exception as e:
+                print(f"Transcription error: {e}")
+            if self.audio_stream.finished:
+                break
+
+            if time.monotonic() - started > Config.RECONNECT_MAX_DELAY:
+                # The session was healthy for a while, so this is a fresh failure
+                delay = Config.RECONNECT_INITIAL_DELAY
+            print(f"Speechmatics session ended unexpectedly; reconnecting in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, Config.RECONNECT_MAX_DELAY)
+
+    def handle_partial_transcript(self, msg):
+        self.speculator.on_partial(self.segmenter.text, msg['metadata']['transcript'])
 
     def handle_final_transcript(self, msg):
-        final_text = msg['metadata']['transcript'].strip()
-        self.transcript_buffer += " " + final_text
-        
-        if final_text.endswith(('.', '!', '?')) or len(self.transcript_buffer.split()) >= 10:
-            persian_text = self.transcript_buffer.strip()
-            self.transcript_buffer = ""
-            
-            with self.print_lock:
-                print(f"\n[Original] {persian_text}")
-
-            def process_translation():
-                translations = self.translation_model.translate(persian_text)
-                self.model.save_transcription(persian_text, translations)
-                
-                with self.print_lock:
-                    for lang in Config.TARGET_LANGUAGES:
-                        print(f"[{lang.upper()}] {translations.get(lang, '')}")
-                    print("\n")
-            
-            threading.Thread(target=process_translation).start()
+        msg = self._stitch(msg)
+        if self.speculator:
+            self.speculator.on_final()
+        for segment in self.segmenter.feed(msg):
+            self._submit_segment(segment)
+
+    def _stitch(self, msg):
+        """
+        Move a final transcript from session time onto the continuous stream timeline,
+        dropping words that were already final before a reconnect replayed their audio
+        """
+        offset = self._session_offset
+        metadata = dict(msg.get('metadata', {}))
+        for key in ('start_time', 'end_time'):
+            if key in metadata:
+                metadata[key] += offset
+
+        results = []
+        for result in msg.get('results') or []:
+            start_time = result.get('start_time', 0.0)
+            result = dict(result, start_time=start_time + offset, end_time=result.get('end_time', start_time) + offset)
+            if (result['start_time'] + result['end_time']) / 2 >= self._resumed_at:
+                results.append(result)
+        if msg.get('results') and not results:
+            metadata['transcript'] = ""
+
+        if 'end_time' in metadata:
+            self._final_until = max(self._final_until, metadata['end_time'])
+            self.audio_stream.finalised(self._final_until)
+        return {**msg, 'metadata': metadata, 'results': results}
+
+    def _submit_segment(self, segment):
+        SEGMENTS.inc()
+        trace = SegmentTrace(
+            captured=self.audio_buffer.captured_at(segment.end_time),
+            spoken=self.audio_buffer.captured_at(segment.start_time)
+        )
+        if self.speculator:
+            self.speculator.claim(segment.text)
+        self.translation_pool.submit(segment.text, trace, lane=self._lane)
+
+    def _translate_segments(self, texts):
+        """Translate a batch taken from the pool; several segments share one GPT request"""
+        if len(texts) == 1:
+            return [self._translate_segment(texts[0])]
+
+        results = [self.speculator.take(text) if self.speculator else None for text in texts]
+        todo = [i for i, result in enumerate(results) if result is None]
+        for i, translations in zip(todo, self.translation_model.translate_batch([texts[i] for i in todo])):
+            results[i] = translations
+        return results
+
+    def _translate_segment(self, persian_text):
+        if self.speculator:
+            translations = self.speculator.take(persian_text)
+            if translations is not None:
+                return translations
+
+        if not Config.TRANSLATION_STREAMING:
+            return self.translation_model.translate(persian_text)
+
+        partial = {}
+
+        def on_translation(lang, translation):
+            # Show each language as soon as its line is complete
+            partial[lang] = translation
+            self.model.publish_partial(persian_text, partial)
+
+        return self.translation_model.translate_stream(persian_text, on_translation)
+
+    def _commit_translation(self, persian_text, translations, trace=None, seq=None):
+        """Save and print a translated segment; called in speech order by the pool (`seq` is its number there)"""
+        # A translation that failed within its deadline is stored blank rather than as an error on air
+        transcription_id = self.model.save_transcription(persian_text, self.translation_model.for_display(translations))
+        if trace:
+            tracer.saved((self.stream_id, transcription_id), trace)
+            if self.latency_controller:
+                self.latency_controller.observe(trace)
+        if segment_logger.isEnabledFor(logging.INFO):
+            segment_logger.info("Segment %d saved", transcription_id, extra={
+                'stream': self.stream_id or 'default',
+                'segment_id': transcription_id,
+                'characters': len(persian_text),
+                'translated': self.translation_model.is_complete(translations),
+                **({f'{stage}_seconds': round(seconds, 3) for stage, seconds in trace.durations().items()}
+                   if trace else {}),
+            })
+
+        prefix = f"[{self.stream_id}] " if self.stream_id else ""
+        with self.print_lock:
+            print(f"\n{prefix}[Original] {persian_text}")
+            for lang in Config.TARGET_LANGUAGES:
+                print(f"[{lang.upper()}] {translations.get(lang, '')}")
+            print("\n")
 
     def get_all_transcriptions(self):
         return self.model.get_all_transcriptions()
@@ -173,20 +518,3 @@ class TranscriptionController:
 
     def mark_as_read(self, timestamp):
         self.model.mark_as_read(timestamp)
-
-class QueueStream:
-    def __init__(self, q):
-        self.queue = q
-        self.running = True
-
-    def read(self, num_bytes):
-        while self.running:
-            try:
-                data = self.queue.get(timeout=2)
-                if data is None:
-                    self.running = False
-                    return b""
-                return data
-            except queue.Empty:
-                continue
-        return b"" 
\ No newline at end of file
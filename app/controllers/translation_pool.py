@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from collections import deque
+from ..models.translation_model import TranslationModel
+
+logger = logging.getLogger(__name__)
+
+
+class _Lane:
+    """Backlog and commit order of one source of segments (one audio stream)"""
+
+    def __init__(self, name, translate_batch, commit):
+        self.name = name
+        self.translate_batch = translate_batch
+        self.commit = commit
+        self.pending = deque()  # [seq, text, trace] waiting for a worker
+        self.next_seq = 0
+        self.commit_lock = threading.Lock()
+        self.results = {}  # seq -> (text, translations, trace, seq), or None for a skipped segment
+        self.next_commit = 0
+        self.merged = 0
+        self.dropped = 0
+
+
+class TranslationPool:
+    """
+    Fixed-size pool of translation workers with a bounded backlog.
+
+    Segments are numbered as they are submitted and results are committed
+    strictly in that order through a reorder buffer, so a slow translation
+    holds back later captions instead of letting them overtake it. A segment
+    may carry a SegmentTrace, which is marked when a worker starts and
+    finishes translating it. `commit(text, translations, trace, seq)` gets
+    every segment that wasn't dropped, with <Error> placeholders when its
+    translation failed.
+
+    Several audio streams can share one pool: each registers a lane with its
+    own translate/commit callbacks, backlog and commit order. Workers serve
+    the lanes with waiting segments in turn, so a busy stream cannot starve
+    the others of translation capacity. The callbacks given to the
+    constructor form the default lane (`lane=None`).
+
+    When several segments of a lane are waiting, a worker takes up to
+    `max_batch` of them at once and hands them to `translate_batch` as a
+    single request. Once it holds more than one segment it waits at most
+    `max_wait` seconds for the batch to fill, so a lone segment is never delayed.
+
+    When a lane's backlog is full, `policy` decides what happens to a new segment:
+      - "block": wait until a worker picks up a queued segment
+      - "merge": append the text to the newest queued segment, as long as it
+        stays within `max_merge_words` words; after that, wait as with "block"
+      - "drop_oldest": discard the oldest queued segment to make room
+    """
+
+    POLICIES = ('block', 'merge', 'drop_oldest')
+
+    def __init__(self, translate_batch=None, commit=None, workers=3, max_pending=8, policy='block',
+                 max_batch=1, max_wait=0.0, max_merge_words=40):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {self.POLICIES}")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_merge_words = max_merge_words
+
+        self._cond = threading.Condition()
+        self._lanes = {}
+        self._turn = 0  # Round-robin position among the lanes
+        self._running = False
+        self._threads = []
+
+        if translate_batch is not None:
+            self.add_lane(None, translate_batch, commit)
+
+    @property
+    def commit(self):
+        """Commit callback of the default lane"""
+        return self._lanes[None].commit
+
+    @commit.setter
+    def commit(self, commit):
+        self._lanes[None].commit = commit
+
+    @property
+    def pending(self):
+        """Number of segments waiting for a worker, over all lanes"""
+        with self._cond:
+            return sum(len(lane.pending) for lane in self._lanes.values())
+
+    @property
+    def merged(self):
+        return sum(lane.merged for lane in self._lanes.values())
+
+    @property
+    def dropped(self):
+        return sum(lane.dropped for lane in self._lanes.values())
+
+    def add_lane(self, name, translate_batch, commit):
+        """Register a stream of segments with its own callbacks, backlog and commit order"""
+        with self._cond:
+            if name in self._lanes:
+                raise ValueError(f"Translation lane '{name}' already exists")
+            self._lanes[name] = _Lane(name, translate_batch, commit)
+
+    def remove_lane(self, name):
+        """Forget a lane whose source has finished; segments still queued in it are discarded"""
+        with self._cond:
+            lane = self._lanes.pop(name, None)
+            if lane is not None and lane.pending:
+                logger.warning("Removed translation lane %s with %d queued segments", name, len(lane.pending))
+
+    def lane_stats(self, name):
+        """(pending, merged, dropped) for one lane"""
+        with self._cond:
+            lane = self._lanes[name]
+            return len(lane.pending), lane.merged, lane.dropped
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"translation-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stop accepting work; workers finish the queued segments before exiting"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, text, trace=None, lane=None):
+        """Queue a segment for translation and return its sequence number within its lane"""
+        dropped_seq = None
+        with self._cond:
+            lane = self._lanes[lane]
+            if len(lane.pending) >= self.max_pending and self.policy == 'merge':
+                newest = lane.pending[-1]
+                if len(newest[1].split()) + len(text.split()) <= self.max_merge_words:
+                    newest[1] = f"{newest[1]} {text}"
+                    # The merged caption waits for the newest speech, so time it from there
+                    newest[2] = trace or newest[2]
+                    lane.merged += 1
+                    return newest[0]
+                # The newest segment is as long as one caption may get
+            if len(lane.pending) >= self.max_pending:
+                if self.policy == 'drop_oldest':
+                    dropped_seq = lane.pending.popleft()[0]
+                    lane.dropped += 1
+                else:
+                    self._cond.wait_for(lambda: len(lane.pending) < self.max_pending or not self._running)
+
+            seq = lane.next_seq
+            lane.next_seq += 1
+            lane.pending.append([seq, text, trace])
+            self._cond.notify_all()
+
+        if dropped_seq is not None:
+            logger.warning("Translation backlog full, dropped segment %s", dropped_seq)
+            self._finish(lane, dropped_seq, None)
+        return seq
+
+    def _worker(self):
+        while True:
+            lane, batch = self._take_batch()
+            if not batch:
+                return
+
+            for _, _, trace in batch:
+                if trace:
+                    trace.mark('translation_started')
+            try:
+                results = lane.translate_batch([text for _, text, _ in batch])
+                results = [
+                    (text, translations, trace, seq) for (seq, text, trace), translations in zip(batch, results)
+                ]
+            except Exception as e:
+                logger.error("Translation of segments %s failed: %s", [seq for seq, _, _ in batch], e)
+                # Still committed, so the caption is saved untranslated instead of disappearing
+                results = [(text, TranslationModel.failed(e), trace, seq) for seq, text, trace in batch]
+            for _, _, trace in batch:
+                if trace:
+                    trace.mark('translation_finished')
+            for (seq, _, _), result in zip(batch, results):
+                self._finish(lane, seq, result)
+
+    def _next_lane(self):
+        """The next lane with waiting segments, in round-robin order"""
+        lanes = list(self._lanes.values())
+        for i in range(len(lanes)):
+            lane = lanes[(self._turn + i) % len(lanes)]
+            if lane.pending:
+                self._turn = (self._turn + i + 1) % len(lanes)
+                return lane
+        return None
+
+    def _take_batch(self):
+        """
+        Take the next segments to translate from one lane; an empty batch
+        means the pool is stopped and drained
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: any(lane.pending for lane in self._lanes.values()) or not self._running)
+            lane = self._next_lane()
+            if lane is None:
+                return None, []
+            batch = []
+            while lane.pending and len(batch) < self.max_batch:
+                batch.append(tuple(lane.pending.popleft()))
+
+            # More than one segment waiting means we are under load: give the batch a moment to fill
+            deadline = time.monotonic() + self.max_wait
+            while 1 < len(batch) < self.max_batch and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+                while lane.pending and len(batch) < self.max_batch:
+                    batch.append(tuple(lane.pending.popleft()))
+
+            # Wake submitters blocked on a full backlog
+            self._cond.notify_all()
+            return lane, batch
+
+    def _finish(self, lane, seq, result):
+        """Record a result and commit every segment of the lane that is now next in line"""
+        with lane.commit_lock:
+            lane.results[seq] = result
+            while lane.next_commit in lane.results:
+                ready = lane.results.pop(lane.next_commit)
+                lane.next_commit += 1
+                if ready is None:
+                    continue
+                try:
+                    lane.commit(*ready)
+                except Exception as e:
+                    logger.error("Committing segment %s of lane %s failed: %s", lane.next_commit - 1, lane.name, e)
@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import defaultdict
+from .config import Config
+from .models.metrics import registry
+
+LOG_RECORDS_DROPPED = registry.counter(
+    'caption_log_records_dropped_total', "Log records discarded because the log queue was full"
+)
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is rendered as a field
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, followed by the record's `extra` fields as key=value pairs"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+                                   for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps one in every `every` records that carry extra={'sample': <key>},
+    counted separately per key. Per-poll debug events stay visible without
+    turning every poll into a log line. Kept records get a `sampled` field
+    saying how many records each one stands for.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or self.every == 1:
+            return True
+        with self._lock:
+            count = self._counts[key]
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them. Message
+    arguments are merged and written out by the listener, so callers only pay
+    for creating the record. Records are dropped, and counted, when the queue
+    is full rather than blocking the caller.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener = None
+
+
+def setup_logging(level=None, fmt=None):
+    """
+    Route all logging through a bounded queue to a background thread that
+    formats the records and writes them to stderr. Call once, from the entry point.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    if (fmt or Config.LOG_FORMAT) == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SampleFilter(Config.LOG_DEBUG_SAMPLE_EVERY))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level or Config.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, handler)
+    _listener.start()
+    # Flush what is still queued on exit
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,301 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Seconds; covers everything from a cache hit to a GPT request that timed out
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Each fn() returns the current value, or {label values: value} for labelled metrics
+        self.sources = {None: fn} if fn else {}
+        self._lock = threading.Lock()
+        # An unlabelled metric reports 0 before its first update
+        self._values = {} if self.labels else {(): 0}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """(suffix, label string, value) lines for the text exposition format"""
+        if self.sources:
+            values = {}
+            for fn in list(self.sources.values()):
+                value = fn()
+                values.update(value if isinstance(value, dict) else {(): value})
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield "", _format_labels(self.labels, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts, then +Inf, sum and count
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labels, key, ('le', _format_value(float(bound)))), cumulative
+            yield "_sum", _format_labels(self.labels, key), counts[-2]
+            yield "_count", _format_labels(self.labels, key), counts[-1]
+
+
+class MetricsRegistry:
+    """
+    Process-wide collection of counters, gauges and histograms, rendered in
+    the Prometheus text exposition format by the /metrics endpoint.
+
+    Updates take one short lock per metric, so they are cheap enough for the
+    audio and translation threads. Values owned by other objects (queue
+    depths, cache statistics) are registered with `fn` and read only when
+    the metrics are scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+
+    def register(self, metric):
+        """Add a metric; a metric registered again under the same name replaces the old one"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=(), fn=None, source=None):
+        return self._metric(Counter, name, documentation, labels, fn, source)
+
+    def gauge(self, name, documentation, labels=(), fn=None, source=None):
+        return self._metric(Gauge, name, documentation, labels, fn, source)
+
+    def _metric(self, cls, name, documentation, labels, fn, source):
+        """
+        Register a metric. With a `source` (e.g. a stream id), `fn` is added to
+        an existing metric of the same name, so one metric collects the values
+        of several components; registering the same source again replaces its fn.
+        """
+        if source is not None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if isinstance(metric, cls) and metric.labels == tuple(labels) and metric.sources:
+                    metric.sources[source] = fn
+                    return metric
+            metric = cls(name, documentation, labels)
+            metric.sources[source] = fn
+            return self.register(metric)
+        return self.register(cls(name, documentation, labels, fn))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception:
+                # A collector whose owner has gone away must not break the whole scrape
+                continue
+        return "\n".join(blocks) + "\n"
+
+
+registry = MetricsRegistry()
+
+SEGMENT_STAGE_SECONDS = registry.histogram(
+    'caption_segment_stage_seconds',
+    "Time a segment spent in each pipeline stage",
+    labels=('stage',)
+)
+SEGMENT_LATENCY_SECONDS = registry.histogram(
+    'caption_segment_latency_seconds',
+    "Time from capturing the last audio of a segment until its caption was saved or served",
+    labels=('until',)
+)
+SEGMENTS = registry.counter('caption_segments_total', "Segments cut from the final transcript")
+DELIVERY_SECONDS = registry.histogram(
+    'caption_delivery_seconds',
+    "Time from saving a caption until an endpoint returned it",
+    labels=('endpoint',)
+)
+GPT_REQUESTS = registry.counter('caption_gpt_requests_total', "Translation requests sent to GPT", labels=('kind',))
+GPT_ERRORS = registry.counter('caption_gpt_errors_total', "Translation requests to GPT that failed", labels=('kind',))
+GPT_REQUEST_SECONDS = registry.histogram(
+    'caption_gpt_request_seconds', "Duration of translation requests to GPT", labels=('kind',)
+)
+GPT_HEDGES = registry.counter(
+    'caption_gpt_hedges_total', "Backup GPT requests sent because the first was slow, and how many answered first",
+    labels=('outcome',)
+)
+GPT_RETRIES = registry.counter('caption_gpt_retries_total', "GPT requests retried after a failure", labels=('kind',))
+
+
+@contextmanager
+def track_gpt_request(kind):
+    """Count and time one GPT request; an exception raised inside counts as an error"""
+    GPT_REQUESTS.inc(kind=kind)
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        GPT_ERRORS.inc(kind=kind)
+        raise
+    finally:
+        GPT_REQUEST_SECONDS.observe(time.monotonic() - started, kind=kind)
+
+
+class SegmentTrace:
+    """
+    Monotonic timestamps of one segment on its way through the pipeline:
+    spoken (its first word), captured (its last word), final,
+    translation_started, translation_finished, saved, served.
+    """
+
+    STAGES = (
+        ('spoken', 'captured', 'segment'),
+        ('captured', 'final', 'transcription'),
+        ('final', 'translation_started', 'queue'),
+        ('translation_started', 'translation_finished', 'translation'),
+        ('translation_finished', 'saved', 'commit'),
+        ('saved', 'served', 'delivery'),
+    )
+
+    __slots__ = ('marks', '_observed')
+
+    def __init__(self, captured=None, spoken=None):
+        self.marks = {'final': time.monotonic()}
+        if captured is not None:
+            self.marks['captured'] = min(captured, self.marks['final'])
+            if spoken is not None:
+                self.marks['spoken'] = min(spoken, self.marks['captured'])
+        self._observed = 0
+
+    def mark(self, stage):
+        self.marks[stage] = time.monotonic()
+
+    def durations(self):
+        """Seconds spent in each completed stage, plus 'latency' since capture when known"""
+        marks = self.marks
+        durations = {
+            stage: marks[end] - marks[start]
+            for start, end, stage in self.STAGES
+            if start in marks and end in marks
+        }
+        if 'captured' in marks:
+            durations['latency'] = max(marks.values()) - marks['captured']
+        return durations
+
+    def observe(self, until):
+        """Record the stages completed since the last call, and the end-to-end latency up to `until`"""
+        marks = self.marks
+        for start, end, stage in self.STAGES[self._observed:]:
+            if start in marks and end in marks:
+                SEGMENT_STAGE_SECONDS.observe(marks[end] - marks[start], stage=stage)
+            self._observed += 1
+            if end == until:
+                break
+        if 'captured' in marks and until in marks:
+            SEGMENT_LATENCY_SECONDS.observe(marks[until] - marks['captured'], until=until)
+
+
+class SegmentTracer:
+    """
+    Keeps the traces of recently saved segments until an endpoint serves them,
+    so the served stage is recorded when the pipeline runs inside the web server.
+    """
+
+    def __init__(self, max_saved=256):
+        self.max_saved = max_saved
+        self._lock = threading.Lock()
+        self._saved = OrderedDict()  # transcription id -> SegmentTrace
+
+    def saved(self, transcription_id, trace):
+        trace.mark('saved')
+        trace.observe('saved')
+        with self._lock:
+            self._saved[transcription_id] = trace
+            while len(self._saved) > self.max_saved:
+                self._saved.popitem(last=False)
+
+    def served(self, transcription_id):
+        with self._lock:
+            trace = self._saved.pop(transcription_id, None)
+        if trace is not None:
+            trace.mark('served')
+            trace.observe('served')
+
+
+tracer = SegmentTracer()
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import httpx
+import openai
+from ..config import Config
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    'caption_gpt_rate_limit_wait_seconds', "Time GPT requests waited for the client-side rate limiter"
+)
+RATE_LIMITED = registry.counter('caption_gpt_rate_limited_total', "GPT requests rejected with HTTP 429")
+
+# '6m0s', '1.5s', '20ms' as used by the x-ratelimit-reset-* headers
+RESET_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+RESET_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds in an x-ratelimit-reset-* or retry-after header value"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = RESET_PART.findall(value)
+        return sum(float(number) * RESET_UNITS[unit] for number, unit in parts) if parts else None
+
+
+class TokenBucket:
+    """
+    Token bucket whose size and fill rate are learned from rate-limit headers.
+
+    Callers take tokens up front, which can push the level below zero, and
+    wait for the time it takes to refill. Concurrent callers are spaced out
+    this way instead of all sending at the same moment. The bucket has no
+    limit until the first headers arrive.
+    """
+
+    def __init__(self, window=60.0):
+        self.window = window  # OpenAI limits are per minute
+        self.capacity = None
+        self.rate = None
+        self.tokens = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        if self.capacity is not None:
+            self.tokens -= amount
+
+    def sync(self, limit, remaining, now):
+        """Adopt the server's view: the limit sets the size and rate, remaining caps the level"""
+        self._refill(now)
+        if self.capacity is None:
+            self.tokens = remaining
+        self.capacity = float(limit)
+        self.rate = self.capacity / self.window
+        self.tokens = min(self.tokens, remaining)
+
+
+class RateLimiter:
+    """
+    Client-side limiter for the OpenAI API shared by every translation worker.
+
+    Requests and tokens each have a bucket driven by the x-ratelimit-*
+    response headers. A 429 pauses every caller until its retry-after has
+    passed. Keeping to the advertised budget avoids bursts of 429s when several
+    workers fire at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self._paused_until = 0.0
+
+    def reserve(self, tokens: int, max_wait: float = None) -> float:
+        """
+        Reserve one request and `tokens` tokens; returns the seconds to wait before sending.
+        Raises TimeoutError without reserving if the wait would exceed `max_wait`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now),
+            )
+            if max_wait is not None and wait > max_wait:
+                raise TimeoutError(f"rate limit would delay the request by {wait:.1f}s")
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        RATE_LIMIT_WAIT_SECONDS.observe(wait)
+        return wait
+
+    def update(self, headers):
+        """Sync the buckets from the x-ratelimit-* headers of a response"""
+        with self._lock:
+            now = time.monotonic()
+            for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+                limit = headers.get(f'x-ratelimit-limit-{kind}')
+                remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                if limit and remaining:
+                    try:
+                        bucket.sync(int(limit), int(remaining), now)
+                    except ValueError:
+                        continue
+
+    def pause(self, headers):
+        """After a 429, hold every request until the server's retry-after (or the reset) has passed"""
+        RATE_LIMITED.inc()
+        delay = (
+            parse_reset(headers.get('retry-after'))
+            or parse_reset(headers.get('x-ratelimit-reset-requests'))
+            or 1.0
+        )
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning("OpenAI rate limit hit, pausing requests for %.1fs", delay)
+
+
+limiter = RateLimiter()
+
+_settings = {}
+_client_lock = threading.Lock()
+_client = None
+_async_clients = {}  # event loop -> AsyncOpenAI; httpx async pools are bound to their loop
+
+
+def configure(api_key: str = None, base_url: str = None):
+    """Override the key or endpoint taken from Config; must be called before the client is first used"""
+    if api_key:
+        _settings['api_key'] = api_key
+    if base_url:
+        _settings['base_url'] = base_url
+
+
+def _client_options() -> Dict:
+    return {
+        'api_key': _settings.get('api_key') or Config.OPENAI_API_KEY,
+        'base_url': _settings.get('base_url') or Config.OPENAI_API_BASE or None,
+        'timeout': Config.TRANSLATION_REQUEST_TIMEOUT,
+        # Retries are done by the caller, with jitter and within the segment's deadline
+        'max_retries': 0,
+    }
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.OPENAI_MAX_CONNECTIONS,
+        keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client() -> openai.OpenAI:
+    """The process-wide OpenAI client, whose connection pool keeps connections to the API open"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = openai.OpenAI(http_client=httpx.Client(limits=_limits()), **_client_options())
+        return _client
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """The AsyncOpenAI client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(http_client=httpx.AsyncClient(limits=_limits()), **_client_options())
+            _async_clients[loop] = client
+        return client
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough token cost of a translation request: the prompt plus an answer about twice its size"""
+    characters = sum(len(message['content']) for message in messages)
+    return max(1, characters // 2) * 3
+
+
+def _note_rate_limit(e):
+    if isinstance(e, openai.RateLimitError):
+        limiter.pause(e.response.headers)
+
+
+def _shorten_timeout(kwargs, waited):
+    # A caller's timeout counts from the call, so time spent throttled comes out of it
+    if kwargs.get('timeout') is not None:
+        kwargs['timeout'] = max(kwargs['timeout'] - waited, 0.1)
+
+
+def chat_completion(messages: List[Dict[str, str]], max_wait: float = None, **kwargs):
+    """
+    chat.completions.create() through the shared client and rate limiter.
+    Waits for the limiter first (at most `max_wait` seconds, else TimeoutError).
+    Returns the parsed completion, or the chunk stream with stream=True.
+    """
+    wait = limiter.reserve(estimate_tokens(messages), max_wait)
+    if wait:
+        time.sleep(wait)
+        _shorten_timeout(kwargs, wait)
+    try:
+        raw = get_client().chat.completions.with_raw_response.create(messages=messages, **kwargs)
+    except openai.APIStatusError as e:
+        _note_rate_limit(e)
+        raise
+    limiter.update(raw.headers)
+    return raw.parse()
+
+
+async def achat_completion(messages: List[Dict[str, str]], max_wait: float = None, **kwargs):
+    """Asynchronous version of chat_completion()"""
+    wait = limiter.reserve(estimate_tokens(messages), max_wait)
+    if wait:
+        await asyncio.sleep(wait)
+        _shorten_timeout(kwargs, wait)
+    try:
+        raw = await get_async_client().chat.completions.with_raw_response.create(messages=messages, **kwargs)
+    except openai.APIStatusError as e:
+        _note_rate_limit(e)
+        raise
+    limiter.update(raw.headers)
+    return raw.parse()
+
+
+def warm_up(connections: int = 1):
+    """
+    Open `connections` pooled connections to the API ahead of the first caption,
+    so no translation pays for DNS, TCP and TLS setup.
+    """
+    client = get_client()
+
+    def touch(_):
+        started = time.monotonic()
+        try:
+            client.models.with_raw_response.list(timeout=Config.TRANSLATION_REQUEST_TIMEOUT)
+            return time.monotonic() - started
+        except Exception as e:
+            logger.warning("OpenAI connection warm-up failed: %s", e)
+            return None
+
+    if connections <= 1:
+        return [touch(0)]
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="openai-warmup") as executor:
+        return list(executor.map(touch, range(connections)))
+
+
+async def awarm_up(connections: int = 1):
+    """Asynchronous version of warm_up() for the running event loop's client"""
+    client = get_async_client()
+
+    async def touch():
+        started = time.monotonic()
+        try:
+            await client.models.with_raw_response.list(timeout=Config.TRANSLATION_REQUEST_TIMEOUT)
+            return time.monotonic() - started
+        except Exception as e:
+            logger.warning("OpenAI connection warm-up failed: %s", e)
+            return None
+
+    return await asyncio.gather(*(touch() for _ in range(max(1, connections))))
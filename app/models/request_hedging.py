@@ -0,0 +1,38 @@
+import random
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent request durations.
+
+    hedge_delay() is how long to wait for a request before sending a backup:
+    the chosen quantile of the window (p95 by default), so only the slowest
+    few percent of requests are ever duplicated. Until `min_samples`
+    durations have been seen it returns `default`.
+    """
+
+    def __init__(self, window=200, quantile=0.95, default=2.5, floor=0.5, min_samples=20):
+        self.quantile = quantile
+        self.default = default
+        self.floor = floor
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=window)
+
+    def observe(self, seconds):
+        with self._lock:
+            self._durations.append(seconds)
+
+    def hedge_delay(self):
+        with self._lock:
+            if len(self._durations) < self.min_samples:
+                return self.default
+            ordered = sorted(self._durations)
+        return max(self.floor, ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))])
+
+
+def retry_delay(attempt, base=0.25, cap=4.0):
+    """Exponential backoff with full jitter for the `attempt`-th retry (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
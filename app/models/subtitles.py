@@ -0,0 +1,36 @@
+from typing import Iterable, Tuple
+
+# (start seconds, end seconds, text)
+Cue = Tuple[float, float, str]
+
+
+def format_timestamp(seconds: float, separator: str = ',') -> str:
+    """HH:MM:SS,mmm as used by SRT; WebVTT uses '.' as the separator"""
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def to_srt(cues: Iterable[Cue]) -> str:
+    """SubRip subtitles; cues without text are left out"""
+    blocks = []
+    for start, end, text in cues:
+        if text:
+            blocks.append(
+                f"{len(blocks) + 1}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n"
+            )
+    return "\n".join(blocks)
+
+
+def to_vtt(cues: Iterable[Cue]) -> str:
+    """WebVTT subtitles; cues without text are left out"""
+    blocks = ["WEBVTT\n"]
+    for start, end, text in cues:
+        if text:
+            blocks.append(f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n")
+    return "\n".join(blocks)
+
+
+FORMATS = {'srt': to_srt, 'vtt': to_vtt}
@@ -1,97 +1,501 @@
 import csv
+import gzip
+import json
 import os
+import re
+import sqlite3
+import threading
 from datetime import datetime
 import logging
+from .transcription_notifier import TranscriptionNotifier, notifier as default_notifier
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+CSV_FIELDS = ['timestamp', 'original_text', 'en_translation', 'nl_translation', 'read']
+
+# Each stream of a multi-stream session has its own store under data/streams/<stream id>/
+STREAMS_DIR = os.path.join('data', 'streams')
+STREAM_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    original_text TEXT NOT NULL,
+    en_translation TEXT NOT NULL DEFAULT '',
+    nl_translation TEXT NOT NULL DEFAULT '',
+    read INTEGER NOT NULL DEFAULT 0  -- Legacy flag, only used to seed the default cursor
+);
+DROP INDEX IF EXISTS idx_transcriptions_unread;
+CREATE INDEX IF NOT EXISTS idx_transcriptions_timestamp
+    ON transcriptions (timestamp);
+CREATE TABLE IF NOT EXISTS consumer_cursors (
+    consumer TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+-- Manifest of finished segments moved out of `transcriptions` into gzipped JSON-lines archives
+CREATE TABLE IF NOT EXISTS archive_segments (
+    file TEXT NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER PRIMARY KEY,
+    first_timestamp TEXT NOT NULL,
+    last_timestamp TEXT NOT NULL,
+    rows INTEGER NOT NULL
+);
+"""
+
+# Cursor of clients that don't name themselves (vMix polling /api/transcriptions)
+DEFAULT_CONSUMER = 'default'
+CONSUMER_ID = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+# Consumer-independent columns served by the history API
+HISTORY_COLUMNS = "id, timestamp, original_text, en_translation, nl_translation"
+
+# `read` as seen by the default consumer, in the shape callers have always received
+ROW_COLUMNS = (
+    "id, timestamp, original_text, en_translation, nl_translation, "
+    "id <= COALESCE((SELECT last_id FROM consumer_cursors WHERE consumer = 'default'), 0) AS read"
+)
+
+
 class TranscriptionModel:
-    def __init__(self, csv_file='data/transcriptions.csv'):
+    """
+    Transcription store backed by an embedded SQLite database in WAL mode.
+
+    Rows are only ever appended. Every consumer (vMix, a caption web page,
+    ...) has its own cursor, the id of the last row it was given, so consumers
+    never take rows from each other and reading only rewrites one small
+    cursor row. The CSV file is kept as an export format (see export_csv) and
+    is imported once into a store that has never held a row.
+
+    The `transcriptions` table only holds the live segment. rotate() moves a
+    finished segment into a gzipped JSON-lines file under archive/ next to
+    the database and records its id and time range in `archive_segments`.
+    Live reads never touch the archives; reads that start before the live
+    segment (history, a consumer that fell behind) continue through them.
+    """
+
+    def __init__(self, db_file='data/transcriptions.db', csv_file='data/transcriptions.csv', notifier=None):
         # Create data directory if it doesn't exist
-        os.makedirs('data', exist_ok=True)
-        
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+
+        self.db_file = db_file
         self.csv_file = csv_file
-        logger.debug(f"Initializing TranscriptionModel with CSV file: {csv_file}")
-        self._ensure_csv_exists()
+        self.notifier = notifier or default_notifier
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()  # Serialises read_next() so a consumer's rows go out once
+        logger.debug("Initializing TranscriptionModel with database: %s", db_file)
+        self._conn = self._connect()
+        self._ensure_schema()
+        self._import_legacy_csv()
+        self._seed_default_cursor()
+
+    def _connect(self):
+        # isolation_level=None leaves transaction control to explicit BEGIN/COMMIT
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        # Lets rotate() give the space of archived rows back; only takes effect on a new database
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
 
-    def _ensure_csv_exists(self):
+    def _ensure_schema(self):
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def _import_legacy_csv(self):
+        """Load rows from an existing CSV file into a store that has never held a transcription"""
         if not os.path.exists(self.csv_file):
-            logger.debug(f"Creating new CSV file: {self.csv_file}")
-            with open(self.csv_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'original_text', 'en_translation', 'nl_translation', 'read'])
-        else:
-            logger.debug(f"CSV file already exists: {self.csv_file}")
+            return
+        with self._lock:
+            # rotate() empties `transcriptions`, and export_csv() writes the CSV this reads. AUTOINCREMENT
+            # keeps the highest id ever used in sqlite_sequence, so a store with history is never re-imported into
+            if self._conn.execute(
+                "SELECT 1 FROM sqlite_sequence WHERE name = 'transcriptions' AND seq > 0"
+            ).fetchone() or self._conn.execute("SELECT 1 FROM archive_segments LIMIT 1").fetchone():
+                return
+            try:
+                with open(self.csv_file, 'r', encoding='utf-8') as f:
+                    rows = [
+                        (
+                            row['timestamp'],
+                            row['original_text'],
+                            row.get('en_translation', ''),
+                            row.get('nl_translation', ''),
+                            1 if row.get('read') == 'true' else 0,
+                        )
+                        for row in csv.DictReader(f)
+                    ]
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO transcriptions (timestamp, original_text, en_translation, nl_translation, read) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+                logger.info("Imported %d transcriptions from %s", len(rows), self.csv_file)
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error("Error importing legacy CSV file: %s", e)
+
+    def _seed_default_cursor(self):
+        """Start the default consumer at the first row the old `read` flags left unread"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO consumer_cursors (consumer, last_id, updated_at) VALUES (?, "
+                "COALESCE((SELECT MIN(id) - 1 FROM transcriptions WHERE read = 0), "
+                "(SELECT MAX(id) FROM transcriptions), 0), ?)",
+                (DEFAULT_CONSUMER, datetime.now().isoformat())
+            )
+
+    @property
+    def archive_dir(self):
+        return os.path.join(os.path.dirname(self.db_file) or '.', 'archive')
+
+    @staticmethod
+    def _row_to_dict(row):
+        transcription = dict(row)
+        transcription['read'] = 'true' if transcription['read'] else 'false'
+        return transcription
 
     def save_transcription(self, original_text, translations):
-        logger.debug(f"Saving transcription: {original_text}")
-        logger.debug(f"Translations: {translations}")
         try:
-            with open(self.csv_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                row = [
-                    datetime.now().isoformat(),
-                    original_text,
-                    translations.get('en', ''),
-                    translations.get('nl', ''),
-                    'false'
-                ]
-                writer.writerow(row)
-                logger.debug(f"Successfully saved row: {row}")
+            row = (
+                datetime.now().isoformat(),
+                original_text,
+                translations.get('en', ''),
+                translations.get('nl', ''),
+            )
+            with self._lock:
+                cursor = self._conn.execute(
+                    "INSERT INTO transcriptions (timestamp, original_text, en_translation, nl_translation) "
+                    "VALUES (?, ?, ?, ?)",
+                    row
+                )
+            logger.debug("Saved transcription %d (%d characters)", cursor.lastrowid, len(original_text))
+            self.notifier.publish('transcription', cursor.lastrowid)
+            return cursor.lastrowid
         except Exception as e:
-            logger.error(f"Error saving transcription: {e}")
+            logger.error("Error saving transcription: %s", e)
             raise
 
+    def publish_partial(self, original_text, translations):
+        """Announce translations of a segment that is still being translated; nothing is stored"""
+        self.notifier.publish('partial', {
+            'original_text': original_text,
+            'en_translation': translations.get('en', ''),
+            'nl_translation': translations.get('nl', ''),
+        })
+
     def get_all_transcriptions(self):
-        logger.debug(f"Reading all transcriptions from: {self.csv_file}")
-        transcriptions = []
         try:
-            with open(self.csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    transcriptions.append(row)
-            logger.debug(f"Found {len(transcriptions)} transcriptions")
+            transcriptions = [self._row_to_dict(row) for row in self._iter_rows(0, with_read=True)]
+            logger.debug("Read %d transcriptions from %s", len(transcriptions), self.db_file)
             return transcriptions
         except Exception as e:
-            logger.error(f"Error reading transcriptions: {e}")
+            logger.error("Error reading transcriptions: %s", e)
             raise
 
-    def get_next_unread_transcription(self):
-        """Get the next unread transcription in chronological order"""
-        logger.debug("Getting next unread transcription")
+    def get_transcriptions_after(self, last_id, limit=50):
+        """Get up to `limit` transcriptions with an id greater than `last_id`, oldest first"""
         try:
-            with open(self.csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['read'] == 'false':
-                        logger.debug(f"Found next unread transcription: {row}")
-                        return row
-            logger.debug("No unread transcriptions found")
+            return [self._row_to_dict(row) for row in self._iter_rows(last_id, limit=limit, with_read=True)]
+        except Exception as e:
+            logger.error("Error reading transcriptions after %s: %s", last_id, e)
+            raise
+
+    def iter_transcriptions(self, since=0, limit=None, until=None):
+        """
+        Yield transcriptions with `since` < id <= `until`, oldest first, at most
+        `limit` of them, continuing from the archives into the live segment.
+        `until` defaults to the latest row at the time of the call. Rows are
+        read a page or an archive line at a time, so a long history is never
+        held in memory and the store isn't locked while the caller consumes them.
+        """
+        return self._iter_rows(since, until, limit)
+
+    def _iter_rows(self, since, until=None, limit=None, with_read=False, page_size=200):
+        if until is None:
+            until = self.get_latest_id()
+        read_until = self.get_cursor() if with_read else None
+        columns = ROW_COLUMNS if with_read else HISTORY_COLUMNS
+        remaining = limit
+        while (remaining is None or remaining > 0) and since < until:
+            size = page_size if remaining is None else min(page_size, remaining)
+            with self._lock:
+                # One read transaction, so a rotation in another process can't slip between the two queries
+                self._conn.execute("BEGIN")
+                try:
+                    segment = self._conn.execute(
+                        "SELECT file, last_id FROM archive_segments WHERE last_id > ? ORDER BY last_id LIMIT 1",
+                        (since,)
+                    ).fetchone()
+                    rows = None if segment else self._conn.execute(
+                        f"SELECT {columns} FROM transcriptions WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                        (since, until, size)
+                    ).fetchall()
+                finally:
+                    self._conn.execute("COMMIT")
+
+            if segment:
+                for row in self._read_segment(segment['file']):
+                    if row['id'] <= since:
+                        continue
+                    if row['id'] > until or remaining == 0:
+                        break
+                    if with_read:
+                        row['read'] = int(row['id'] <= read_until)
+                    yield row
+                    since = row['id']
+                    if remaining is not None:
+                        remaining -= 1
+                if remaining != 0:
+                    since = max(since, segment['last_id'])
+                continue
+
+            for row in rows:
+                yield dict(row)
+            if len(rows) < size:
+                return
+            since = rows[-1]['id']
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def _read_segment(self, file):
+        with gzip.open(os.path.join(self.archive_dir, file), 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def get_segments(self):
+        """The manifest: archived segments with their id and timestamp ranges, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM archive_segments ORDER BY last_id").fetchall()
+        return [dict(row) for row in rows]
+
+    def rotate(self, max_rows=None, max_age=None):
+        """
+        Archive the live segment once it holds `max_rows` rows or its oldest row
+        is `max_age` seconds old; with neither given it is archived unconditionally
+        (e.g. when a new session starts). Returns the manifest entry, or None.
+        """
+        with self._lock:
+            count, first_id, last_id, first_timestamp, last_timestamp = self._conn.execute(
+                "SELECT COUNT(*), MIN(id), MAX(id), MIN(timestamp), MAX(timestamp) FROM transcriptions"
+            ).fetchone()
+        if not count:
             return None
+        if max_rows is not None or max_age is not None:
+            age = (datetime.now() - datetime.fromisoformat(first_timestamp)).total_seconds()
+            if (max_rows is None or count < max_rows) and (max_age is None or age < max_age):
+                return None
+
+        segment = {
+            'file': f"transcriptions-{first_id:08d}-{last_id:08d}.jsonl.gz",
+            'first_id': first_id,
+            'last_id': last_id,
+            'first_timestamp': first_timestamp,
+            'last_timestamp': last_timestamp,
+            'rows': count,
+        }
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, segment['file'])
+        try:
+            # Saved rows never change, so the archive is written without holding up the live path
+            with gzip.open(f"{path}.tmp", 'wt', encoding='utf-8') as f:
+                for transcription in self._iter_rows(first_id - 1, last_id):
+                    f.write(json.dumps(transcription, ensure_ascii=False) + '\n')
+            os.replace(f"{path}.tmp", path)
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute(
+                        "INSERT INTO archive_segments (file, first_id, last_id, first_timestamp, last_timestamp, rows) "
+                        "VALUES (:file, :first_id, :last_id, :first_timestamp, :last_timestamp, :rows)",
+                        segment
+                    )
+                    self._conn.execute("DELETE FROM transcriptions WHERE id <= ?", (last_id,))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("PRAGMA incremental_vacuum")
+            logger.info("Archived transcriptions %d-%d (%d rows) to %s", first_id, last_id, count, path)
+            return segment
         except Exception as e:
-            logger.error(f"Error getting next unread transcription: {e}")
+            logger.error("Error archiving transcriptions %d-%d: %s", first_id, last_id, e)
+            raise
+
+    def get_latest(self):
+        """(id, timestamp) of the most recently saved transcription, or (0, None) for an empty store"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, timestamp FROM transcriptions ORDER BY id DESC LIMIT 1"
+            ).fetchone() or self._conn.execute(
+                # Right after a rotation the live segment is empty
+                "SELECT last_id, last_timestamp FROM archive_segments ORDER BY last_id DESC LIMIT 1"
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def get_latest_id(self):
+        """Id of the most recently saved transcription, or 0 for an empty store"""
+        return self.get_latest()[0]
+
+    def get_cursor(self, consumer=DEFAULT_CONSUMER):
+        """Id of the last transcription given to `consumer`; 0 for a consumer that has read nothing"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_id FROM consumer_cursors WHERE consumer = ?", (consumer,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def read_next(self, consumer=DEFAULT_CONSUMER, limit=1, since=None):
+        """
+        Get up to `limit` transcriptions after the cursor of `consumer`, or
+        after id `since` when given, oldest first, and move the cursor past
+        them. A new consumer starts at the live tail, so it only receives
+        what is saved from then on; other consumers' cursors are not affected.
+        """
+        try:
+            with self._read_lock:
+                start = self._join(consumer) if since is None else since
+                transcriptions = [
+                    self._row_to_dict(row)
+                    for row in self._iter_rows(start, limit=limit, with_read=True)
+                ]
+                if transcriptions:
+                    with self._lock:
+                        self._advance(consumer, transcriptions[-1]['id'])
+            # Called on every poll; the log pipeline keeps a sample of these (see app.logging_config)
+            logger.debug(
+                "Consumer %s read %d transcriptions", consumer, len(transcriptions), extra={'sample': 'poll'}
+            )
+            return transcriptions
+        except Exception as e:
+            logger.error("Error reading transcriptions for consumer %s: %s", consumer, e)
+            raise
+
+    def _join(self, consumer):
+        """The cursor of `consumer`, created at the latest transcription the first time the consumer reads"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_id FROM consumer_cursors WHERE consumer = ?", (consumer,)
+            ).fetchone()
+        if row:
+            return row[0]
+        last_id = self.get_latest_id()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO consumer_cursors (consumer, last_id, updated_at) VALUES (?, ?, ?)",
+                (consumer, last_id, datetime.now().isoformat())
+            )
+        logger.info("Consumer %s starts after transcription %d", consumer, last_id)
+        return last_id
+
+    def _advance(self, consumer, last_id):
+        # Cursors only move forward, so a slow duplicate request can't replay rows
+        self._conn.execute(
+            "INSERT INTO consumer_cursors (consumer, last_id, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (consumer) DO UPDATE SET "
+            "last_id = MAX(last_id, excluded.last_id), updated_at = excluded.updated_at",
+            (consumer, last_id, datetime.now().isoformat())
+        )
+
+    def get_next_unread_transcription(self):
+        """Get the next transcription after the default consumer's cursor, without moving it"""
+        try:
+            row = next(self._iter_rows(self.get_cursor(), limit=1, with_read=True), None)
+            logger.debug(
+                "Next unread transcription: %s", row['id'] if row else None, extra={'sample': 'poll'}
+            )
+            return self._row_to_dict(row) if row else None
+        except Exception as e:
+            logger.error("Error getting next unread transcription: %s", e)
             raise
 
     def mark_as_read(self, timestamp):
-        logger.debug(f"Marking transcription as read: {timestamp}")
-        rows = []
+        """Move the default consumer's cursor past the transcription saved at `timestamp`"""
         try:
-            with open(self.csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                fieldnames = reader.fieldnames
-                for row in reader:
-                    if row['timestamp'] == timestamp:
-                        row['read'] = 'true'
-                        logger.debug(f"Found and marked row: {row}")
-                    rows.append(row)
-
-            with open(self.csv_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT MAX(id) FROM transcriptions WHERE timestamp = ?", (timestamp,)
+                ).fetchone()
+                segment = None if row[0] is not None else self._conn.execute(
+                    "SELECT file FROM archive_segments WHERE ? BETWEEN first_timestamp AND last_timestamp",
+                    (timestamp,)
+                ).fetchone()
+            last_id = row[0]
+            if segment:
+                last_id = max(
+                    (t['id'] for t in self._read_segment(segment['file']) if t['timestamp'] == timestamp),
+                    default=None
+                )
+            if last_id is not None:
+                with self._lock:
+                    self._advance(DEFAULT_CONSUMER, last_id)
+            logger.debug("Marked transcriptions up to %s as read", last_id, extra={'sample': 'poll'})
+        except Exception as e:
+            logger.error("Error marking transcription as read: %s", e)
+            raise
+
+    def export_csv(self, csv_file=None):
+        """Write the whole store to a CSV file in the original column layout"""
+        csv_file = csv_file or self.csv_file
+        logger.debug("Exporting transcriptions to: %s", csv_file)
+        tmp_file = f"{csv_file}.tmp"
+        try:
+            rows = self._iter_rows(0, with_read=True)
+            with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
                 writer.writeheader()
-                writer.writerows(rows)
-            logger.debug("Successfully updated CSV file")
+                writer.writerows(self._row_to_dict(row) for row in rows)
+            # Replace atomically so readers never see a half-written export
+            os.replace(tmp_file, csv_file)
+            return csv_file
         except Exception as e:
-            logger.error(f"Error marking transcription as read: {e}")
-            raise 
\ No newline at end of file
+            logger.error("Error exporting transcriptions: %s", e)
+            raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stream_stores = {}
+_stream_stores_lock = threading.Lock()
+_default_store = None
+
+
+def default_store():
+    """The store of the single-stream setup (data/transcriptions.db), opened on first use"""
+    global _default_store
+    with _stream_stores_lock:
+        if _default_store is None:
+            _default_store = TranscriptionModel()
+        return _default_store
+
+
+def stream_store(stream_id, create=True):
+    """
+    The TranscriptionModel of one stream, shared by everything in the process
+    that uses it so in-process writers wake its readers. Returns None for an
+    invalid id, or for a stream without a store when `create` is False.
+    """
+    if not STREAM_ID.match(stream_id or ''):
+        return None
+    with _stream_stores_lock:
+        store = _stream_stores.get(stream_id)
+        if store is None:
+            stream_dir = os.path.join(STREAMS_DIR, stream_id)
+            db_file = os.path.join(stream_dir, 'transcriptions.db')
+            if not create and not os.path.exists(db_file):
+                return None
+            store = TranscriptionModel(
+                db_file=db_file,
+                csv_file=os.path.join(stream_dir, 'transcriptions.csv'),
+                notifier=TranscriptionNotifier()
+            )
+            _stream_stores[stream_id] = store
+        return store
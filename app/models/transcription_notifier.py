@@ -0,0 +1,44 @@
+import threading
+from collections import deque
+
+
+class TranscriptionNotifier:
+    """
+    In-process fan-out of store events to waiting consumers.
+
+    Every published event gets a monotonically increasing version. Consumers
+    remember the last version they handled and block in wait() until a newer
+    one arrives, so an idle stream costs no polling and no disk I/O.
+    """
+
+    def __init__(self, history=256):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._version = 0
+
+    @property
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def publish(self, event, data=None):
+        """Publish an event to every waiting consumer and return its version"""
+        with self._cond:
+            self._version += 1
+            self._events.append((self._version, event, data))
+            self._cond.notify_all()
+            return self._version
+
+    def wait(self, version, timeout=None):
+        """
+        Block until an event newer than `version` is published or the timeout expires.
+        Returns (latest_version, [(version, event, data), ...]) with the events missed since `version`.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > version, timeout)
+            events = [e for e in self._events if e[0] > version]
+            return self._version, events
+
+
+# Shared by every TranscriptionModel in the process
+notifier = TranscriptionNotifier()
@@ -0,0 +1,103 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arabic code points that Persian text often uses interchangeably with the Persian ones
+_CHAR_MAP = str.maketrans({'ي': 'ی', 'ك': 'ک', '‌': ' '})
+
+
+class TranslationCache:
+    """
+    Two-tier translation cache: an in-memory LRU in front of an optional SQLite file.
+
+    Entries are keyed on the normalized source text, the source language and
+    the set of target languages, and expire after `ttl` seconds. A memory miss
+    falls through to the disk tier, and disk hits are promoted back into memory,
+    so phrases cached at a previous show are still cheap after a restart.
+    """
+
+    def __init__(self, max_entries=2048, ttl=None, db_file=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (stored_at, translations)
+        self._conn = None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if db_file:
+            os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translation_cache ("
+                "key TEXT PRIMARY KEY, translations TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            if ttl:
+                self._conn.execute("DELETE FROM translation_cache WHERE stored_at < ?", (time.time() - ttl,))
+
+    @staticmethod
+    def make_key(text, source_lang, target_langs, model):
+        normalized = " ".join(text.translate(_CHAR_MAP).casefold().split())
+        return f"{model}|{source_lang}|{','.join(sorted(target_langs))}|{normalized}"
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, key):
+        """Return cached translations for a key, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return dict(entry[1])
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT translations, stored_at FROM translation_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    translations = json.loads(row[0])
+                    self._remember(key, row[1], translations)
+                    self.stats['disk_hits'] += 1
+                    return dict(translations)
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, translations):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, dict(translations))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO translation_cache (key, translations, stored_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(translations, ensure_ascii=False), stored_at)
+                )
+
+    def _remember(self, key, stored_at, translations):
+        # Caller holds self._lock
+        self._memory[key] = (stored_at, translations)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._memory)
+
+    @staticmethod
+    def load_phrases(path):
+        """Read a warm-up phrase list: one phrase per line, blank lines and # comments ignored"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
@@ -1,51 +1,571 @@
-import openai
-from typing import Dict, List
+import asyncio
+import logging
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 from ..config import Config
+from .translation_cache import TranslationCache
+from .metrics import GPT_HEDGES, GPT_RETRIES, track_gpt_request
+from .openai_client import achat_completion, chat_completion
+from .request_hedging import LatencyTracker, retry_delay
+
+logger = logging.getLogger(__name__)
+
+# One line of a batched answer: '<segment number> <lang_code>: <translation>'
+BATCH_LINE = re.compile(r'^\s*\[?(\d+)\]?[\s.:)-]+([A-Za-z-]+):\s*(.*)$')
+
+# Concurrent translations while warming up the cache
+WARMUP_WORKERS = 4
+
+
+class _HedgeRace:
+    """
+    The decisions of one hedged attempt, shared by the thread and asyncio
+    versions: how long to wait, which finished request answers and when to
+    send the backup request. The caller only does the waiting and submitting.
+    """
+
+    def __init__(self, hedge_delay: float, deadline: float):
+        self.deadline = deadline
+        self.hedge_at = time.monotonic() + hedge_delay
+        self.hedged = False
+        self.error = None
+
+    def wait_time(self) -> float:
+        """Seconds to wait for a request: until the hedge delay, then until the deadline"""
+        until = self.deadline if self.hedged else min(self.hedge_at, self.deadline)
+        return max(0.0, until - time.monotonic())
+
+    def first_answer(self, done, primary) -> Optional[Tuple[str, str]]:
+        """The output of the first successful finished future or task; failures are kept in `error`"""
+        for future in done:
+            if future.exception():
+                self.error = future.exception()
+                continue
+            if future is not primary:
+                GPT_HEDGES.inc(outcome='won')
+            return future.result()
+        return None
+
+    def fire(self, running) -> bool:
+        """True when the backup request should be sent now; raises TimeoutError at the deadline"""
+        now = time.monotonic()
+        if now >= self.deadline:
+            raise TimeoutError(f"no GPT answer within {Config.TRANSLATION_DEADLINE}s")
+        if self.hedged or not running or now < self.hedge_at:
+            return False
+        # The first request is in its slowest tail: race a backup against it
+        self.hedged = True
+        GPT_HEDGES.inc(outcome='fired')
+        return True
+
+    @staticmethod
+    def model(primary_model: str) -> str:
+        return Config.TRANSLATION_FALLBACK_MODEL or primary_model
+
 
 class TranslationModel:
-    def __init__(self):
-        self.api_key = Config.OPENAI_API_KEY
-        openai.api_key = self.api_key
+    def __init__(self, cache: Optional[TranslationCache] = None, workers: int = None, speculations: int = None):
+        """
+        `workers` is the number of translation pool workers using this model
+        (TRANSLATION_WORKERS by default) and `speculations` the speculative
+        translations that may run next to them (one live stream's worth by
+        default); together they size the request threads.
+        """
+        if cache is None and Config.TRANSLATION_CACHE_SIZE:
+            cache = TranslationCache(
+                max_entries=Config.TRANSLATION_CACHE_SIZE,
+                ttl=Config.TRANSLATION_CACHE_TTL,
+                db_file=Config.TRANSLATION_CACHE_FILE
+            )
+        self.cache = cache
+        # Model of the first request of every translation; the latency controller may swap in a faster one
+        self.model = Config.TRANSLATION_MODEL
+        # Hedge delays are derived separately for single and batched requests, which differ in length
+        self.latency = {
+            kind: LatencyTracker(
+                quantile=Config.TRANSLATION_HEDGE_QUANTILE,
+                default=Config.TRANSLATION_HEDGE_DEFAULT_DELAY,
+                floor=Config.TRANSLATION_HEDGE_MIN_DELAY
+            )
+            for kind in ('single', 'batch')
+        }
+        if workers is None:
+            workers = Config.TRANSLATION_WORKERS
+        if speculations is None:
+            speculations = Config.SPECULATION_MAX_IN_FLIGHT if Config.SPECULATIVE_TRANSLATION else 0
+        # Primary and hedged requests of every caller run here, so hedging never blocks a worker
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * (workers + speculations + WARMUP_WORKERS), thread_name_prefix="gpt-request"
+        )
+
+    def _cache_get(self, text: str, source_lang: str, target_langs: List[str]) -> Optional[Dict[str, str]]:
+        # Main-model translations are served whichever model is answering right now
+        if self.cache is None:
+            return None
+        return self.cache.get(TranslationCache.make_key(text, source_lang, target_langs, Config.TRANSLATION_MODEL))
+
+    def _cache_put(self, text: str, source_lang: str, target_langs: List[str], translations: Dict[str, str],
+                   model: str):
+        # Never cache errors, incomplete answers or answers of the fallback and fast models
+        if self.cache is not None and model == Config.TRANSLATION_MODEL and self.is_complete(translations):
+            self.cache.put(TranslationCache.make_key(text, source_lang, target_langs, model), translations)
+
+    @staticmethod
+    def is_complete(translations: Dict[str, str]) -> bool:
+        """True if no language carries an <Error ...> or <Missing ...> placeholder"""
+        return not any(value.startswith(('<Error', '<Missing')) for value in translations.values())
+
+    def warm_up_cache(self, phrases: List[str], workers: int = WARMUP_WORKERS) -> int:
+        """
+        Translate every phrase of a warm-up list that isn't cached yet, so it is
+        served from the cache during the show. Returns the number of cached phrases.
+        """
+        if self.cache is None:
+            return 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-warmup") as executor:
+            return sum(self.is_complete(t) for t in executor.map(self.translate, phrases))
+
+    @staticmethod
+    def failed(error: Exception, target_langs: List[str] = None) -> Dict[str, str]:
+        """The <Error ...> placeholders for a segment that could not be translated"""
+        return {lang: f"<Error: {error}>" for lang in target_langs or Config.TARGET_LANGUAGES}
+
+    @staticmethod
+    def for_display(translations: Dict[str, str]) -> Dict[str, str]:
+        """Blank out <Error ...>/<Missing ...> placeholders so they never reach the screen"""
+        return {
+            lang: '' if value.startswith(('<Error', '<Missing')) else value
+            for lang, value in translations.items()
+        }
+
+    def _request_kwargs(self, messages: List[Dict[str, str]], model: str, deadline: float) -> Dict:
+        """Arguments of one chat completion request, abandoned at the per-request timeout or the deadline"""
+        timeout = min(Config.TRANSLATION_REQUEST_TIMEOUT, deadline - time.monotonic())
+        if timeout <= 0:
+            raise TimeoutError("translation deadline passed")
+        return dict(
+            model=model,
+            messages=messages,
+            temperature=0.0,
+            timeout=timeout,
+            max_wait=min(Config.OPENAI_MAX_THROTTLE, timeout),
+        )
+
+    def _observe(self, model: str, kind: str, started: float):
+        # Only the primary model's timings decide when to hedge
+        if model == self.model:
+            self.latency[kind].observe(time.monotonic() - started)
+
+    def _request(self, messages: List[Dict[str, str]], model: str, kind: str, deadline: float) -> Tuple[str, str]:
+        """One chat completion request; returns (model, answer)"""
+        kwargs = self._request_kwargs(messages, model, deadline)
+        started = time.monotonic()
+        with track_gpt_request(kind):
+            response = chat_completion(**kwargs)
+        self._observe(model, kind, started)
+        return model, response.choices[0].message.content.strip()
+
+    async def _arequest(self, messages: List[Dict[str, str]], model: str, kind: str,
+                        deadline: float) -> Tuple[str, str]:
+        kwargs = self._request_kwargs(messages, model, deadline)
+        started = time.monotonic()
+        with track_gpt_request(kind):
+            response = await achat_completion(**kwargs)
+        self._observe(model, kind, started)
+        return model, response.choices[0].message.content.strip()
+
+    @staticmethod
+    def _retry_delay(attempt: int, kind: str, error: Exception, deadline: float) -> Optional[float]:
+        """Backoff before the `attempt`-th retry, or None when the retries or the deadline are used up"""
+        delay = retry_delay(attempt, Config.TRANSLATION_RETRY_BASE_DELAY)
+        if attempt > Config.TRANSLATION_RETRIES or time.monotonic() + delay >= deadline:
+            return None
+        logger.warning("GPT %s request failed (%s), retry %d in %.2fs", kind, error, attempt, delay)
+        GPT_RETRIES.inc(kind=kind)
+        return delay
+
+    def _complete(self, messages: List[Dict[str, str]], kind: str, deadline: float = None) -> Tuple[str, str]:
+        """
+        Get a completion before `deadline` (monotonic seconds, TRANSLATION_DEADLINE from now by default)
+        as (model that answered, answer).
+        If the request is still running after the hedge delay, a backup request
+        goes to the fallback model and whichever answers first is used. When
+        every request of an attempt fails, the attempt is retried after a
+        jittered backoff, up to TRANSLATION_RETRIES times.
+        """
+        deadline = deadline or time.monotonic() + Config.TRANSLATION_DEADLINE
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(messages, kind, deadline)
+            except Exception as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, kind, e, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _acomplete(self, messages: List[Dict[str, str]], kind: str, deadline: float = None) -> Tuple[str, str]:
+        """_complete() on the event loop; the slower of two hedged requests is cancelled"""
+        deadline = deadline or time.monotonic() + Config.TRANSLATION_DEADLINE
+        attempt = 0
+        while True:
+            try:
+                return await self._ahedged(messages, kind, deadline)
+            except Exception as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, kind, e, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _hedged(self, messages: List[Dict[str, str]], kind: str, deadline: float) -> Tuple[str, str]:
+        race = _HedgeRace(self.latency[kind].hedge_delay(), deadline)
+        primary = self._executor.submit(self._request, messages, self.model, kind, deadline)
+        running = {primary}
+        while running:
+            done, running = wait(running, timeout=race.wait_time(), return_when=FIRST_COMPLETED)
+            output = race.first_answer(done, primary)
+            if output is not None:
+                return output
+            if race.fire(running):
+                running.add(self._executor.submit(self._request, messages, race.model(self.model), kind, deadline))
+        raise race.error
+
+    async def _ahedged(self, messages: List[Dict[str, str]], kind: str, deadline: float) -> Tuple[str, str]:
+        race = _HedgeRace(self.latency[kind].hedge_delay(), deadline)
+        primary = asyncio.ensure_future(self._arequest(messages, self.model, kind, deadline))
+        running = {primary}
+        try:
+            while running:
+                done, running = await asyncio.wait(
+                    running, timeout=race.wait_time(), return_when=asyncio.FIRST_COMPLETED
+                )
+                output = race.first_answer(done, primary)
+                if output is not None:
+                    return output
+                if race.fire(running):
+                    running.add(asyncio.ensure_future(
+                        self._arequest(messages, race.model(self.model), kind, deadline)
+                    ))
+            raise race.error
+        finally:
+            for task in running:
+                task.cancel()
 
-    def translate(self, text: str, source_lang: str = None, target_langs: List[str] = None) -> Dict[str, str]:
+    def _build_messages(self, text: str, source_lang: str, target_langs: List[str]) -> List[Dict[str, str]]:
+        langs_str = ", ".join(target_langs)
+        system_prompt = (
+            f"Translate this {source_lang} text to {langs_str}. "
+            f"Output format: 'lang_code: translation' per line. "
+            f"No extra text."
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+
+    def translate(self, text: str, source_lang: str = None, target_langs: List[str] = None,
+                  deadline: float = None) -> Dict[str, str]:
         """
         Translate text from source language to multiple target languages using GPT-4
         Returns a dictionary of {lang_code: translation}
         """
-        source_lang = source_lang or Config.SOURCE_LANGUAGE
-        target_langs = target_langs or Config.TARGET_LANGUAGES
+        source_lang, target_langs = self._languages(source_lang, target_langs)
+        cached = self._cache_get(text, source_lang, target_langs)
+        if cached is not None:
+            return cached
 
         try:
-            langs_str = ", ".join(target_langs)
-            system_prompt = (
-                f"Translate this {source_lang} text to {langs_str}. "
-                f"Output format: 'lang_code: translation' per line. "
-                f"No extra text."
-            )
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.0,
-            )
-            translated_output = response["choices"][0]["message"]["content"].strip()
-            return self._parse_translations(translated_output, target_langs)
+            answer = self._complete(self._build_messages(text, source_lang, target_langs), 'single', deadline)
+            return self._translated(text, source_lang, target_langs, answer)
         except Exception as e:
-            return {lang: f"<Error: {e}>" for lang in target_langs}
+            logger.error("Translation failed: %s", e)
+            return self.failed(e, target_langs)
 
-    def _parse_translations(self, output: str, target_langs: List[str]) -> Dict[str, str]:
-        """Parse GPT's response into translation dictionary"""
+    @staticmethod
+    def _languages(source_lang: Optional[str], target_langs: Optional[List[str]]) -> Tuple[str, List[str]]:
+        return source_lang or Config.SOURCE_LANGUAGE, target_langs or Config.TARGET_LANGUAGES
+
+    def _translated(self, text: str, source_lang: str, target_langs: List[str],
+                    answer: Tuple[str, str]) -> Dict[str, str]:
+        """Parse a (model, answer) completion of one segment and cache it"""
+        model, output = answer
+        translations = self._parse_translations(output, target_langs)
+        self._cache_put(text, source_lang, target_langs, translations, model)
+        return translations
+
+    def translate_stream(self, text: str, on_translation: Optional[Callable[[str, str], None]] = None,
+                         source_lang: str = None, target_langs: List[str] = None) -> Dict[str, str]:
+        """
+        Translate like translate(), but consume the completion token by token.
+        on_translation(lang_code, translation) is called as soon as each
+        'lang_code: translation' line is complete, before the rest of the output arrives.
+        The stream is read on a request thread. If no line has arrived by the
+        hedge delay, a backup request to the fallback model races it and each
+        language is taken from whichever answers first. Languages that are
+        still missing once both have ended come from a retried request within
+        what is left of the deadline; the stream is abandoned at the deadline.
+        Returns the same dictionary as translate()
+        """
+        source_lang, target_langs = self._languages(source_lang, target_langs)
+        cached = self._cache_get(text, source_lang, target_langs)
+        if cached is not None:
+            if on_translation:
+                for lang in target_langs:
+                    on_translation(lang, cached[lang])
+            return cached
+
+        messages = self._build_messages(text, source_lang, target_langs)
         translations = {}
+        models = set()  # Models that answered a language
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def emit(model, lang, translation):
+            # Called from the request threads; nothing is reported once the answer has been returned
+            with lock:
+                if finished.is_set() or lang in translations:
+                    return
+                translations[lang] = translation
+                models.add(model)
+                if on_translation:
+                    on_translation(lang, translation)
+
+        def missing():
+            with lock:
+                return [lang for lang in target_langs if lang not in translations]
+
+        started = time.monotonic()
+        deadline = started + Config.TRANSLATION_DEADLINE
+        hedge_at = started + self.latency['single'].hedge_delay()
+        stream = self._executor.submit(self._stream, messages, self.model, target_langs, deadline, emit, finished)
+        running = {stream}
+        hedged = False
+        error = None
+        while running and missing() and time.monotonic() < deadline:
+            until = deadline if hedged else min(hedge_at, deadline)
+            done, running = wait(running, timeout=max(0.0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    output = future.result()
+                except Exception as e:
+                    error = e
+                    logger.warning("%s translation failed: %s", "Streaming" if future is stream else "Hedged", e)
+                    continue
+                if future is not stream:
+                    model, answer = output
+                    if missing():
+                        GPT_HEDGES.inc(outcome='won')
+                    for lang, translation in self._parse_translations(answer, target_langs).items():
+                        if not translation.startswith('<Missing'):
+                            emit(model, lang, translation)
+
+            if not hedged and running and time.monotonic() >= hedge_at and len(missing()) == len(target_langs):
+                # Nothing usable yet from a slow stream; race a backup request against it
+                hedged = True
+                GPT_HEDGES.inc(outcome='fired')
+                running.add(self._executor.submit(
+                    self._request, messages, Config.TRANSLATION_FALLBACK_MODEL or self.model, 'single', deadline
+                ))
+
+        if missing() and time.monotonic() < deadline and not running:
+            # The stream (and backup) ended without every language: retry within the same deadline
+            try:
+                model, answer = self._complete(messages, 'single', deadline)
+                for lang, translation in self._parse_translations(answer, target_langs).items():
+                    if not translation.startswith('<Missing'):
+                        emit(model, lang, translation)
+            except Exception as e:
+                error = e
+                logger.error("Translation failed: %s", e)
+
+        with lock:
+            finished.set()
+            answered = dict(translations)
+        gone = [lang for lang in target_langs if lang not in answered]
+        if gone:
+            error = error or TimeoutError(f"no GPT answer within {Config.TRANSLATION_DEADLINE}s")
+            answered.update(self.failed(error, gone))
+        elif len(models) == 1:
+            self._cache_put(text, source_lang, target_langs, answered, models.pop())
+        return {lang: answered[lang] for lang in target_langs}
+
+    def _stream(self, messages: List[Dict[str, str]], model: str, target_langs: List[str], deadline: float,
+                emit: Callable[[str, str, str], None], finished: threading.Event):
+        """
+        Read a streamed completion, passing (model, lang_code, translation) to
+        `emit` for every complete line. Gives up at the deadline or once
+        `finished` is set; a stream read to its end is timed like a single request.
+        """
+        kwargs = self._request_kwargs(messages, model, deadline)
+        started = time.monotonic()
+
+        def emit_line(line):
+            parsed = self._parse_line(line, target_langs)
+            if parsed:
+                emit(model, *parsed)
+
+        with track_gpt_request('stream'):
+            response = chat_completion(stream=True, **kwargs)
+            pending = ""
+            try:
+                for chunk in response:
+                    if chunk.choices:
+                        pending += chunk.choices[0].delta.content or ""
+                    *lines, pending = pending.split('\n')
+                    for line in lines:
+                        emit_line(line)
+                    if finished.is_set():
+                        return
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError("translation deadline passed")
+                emit_line(pending)
+            finally:
+                # Hand the connection back to the pool even when the stream is abandoned
+                response.response.close()
+        self._observe(model, 'single', started)
+
+    async def atranslate(self, text: str, source_lang: str = None, target_langs: List[str] = None,
+                         deadline: float = None) -> Dict[str, str]:
+        """translate() for the asyncio pipeline"""
+        source_lang, target_langs = self._languages(source_lang, target_langs)
+        cached = self._cache_get(text, source_lang, target_langs)
+        if cached is not None:
+            return cached
+
+        try:
+            answer = await self._acomplete(self._build_messages(text, source_lang, target_langs), 'single', deadline)
+            return self._translated(text, source_lang, target_langs, answer)
+        except Exception as e:
+            logger.error("Translation failed: %s", e)
+            return self.failed(e, target_langs)
+
+    def translate_batch(self, texts: List[str], source_lang: str = None,
+                        target_langs: List[str] = None) -> List[Dict[str, str]]:
+        """
+        Translate several segments with a single GPT-4 request.
+        Segments are numbered in the prompt and the answer is split back per
+        segment; any segment the answer doesn't cover is translated on its own
+        within what is left of the same deadline.
+        Returns one {lang_code: translation} dictionary per input text, in order
+        """
+        source_lang, target_langs = self._languages(source_lang, target_langs)
+        deadline = time.monotonic() + Config.TRANSLATION_DEADLINE
+        results, todo = self._batch_todo(texts, source_lang, target_langs)
+        if len(todo) == 1:
+            results[todo[0]] = self.translate(texts[todo[0]], source_lang, target_langs, deadline)
+        elif todo:
+            try:
+                answer = self._complete(
+                    self._build_batch_messages([texts[i] for i in todo], source_lang, target_langs), 'batch', deadline
+                )
+            except Exception as e:
+                logger.error("Batch translation failed: %s", e)
+                answer = None
+            for i in self._merge_batch(texts, todo, answer, results, source_lang, target_langs):
+                # The model skipped or mangled this segment; fall back to a single request
+                results[i] = self.translate(texts[i], source_lang, target_langs, deadline)
+        return results
+
+    async def atranslate_batch(self, texts: List[str], source_lang: str = None,
+                               target_langs: List[str] = None) -> List[Dict[str, str]]:
+        """translate_batch() for the asyncio pipeline; the single-segment fallbacks run concurrently"""
+        source_lang, target_langs = self._languages(source_lang, target_langs)
+        deadline = time.monotonic() + Config.TRANSLATION_DEADLINE
+        results, todo = self._batch_todo(texts, source_lang, target_langs)
+        if len(todo) == 1:
+            results[todo[0]] = await self.atranslate(texts[todo[0]], source_lang, target_langs, deadline)
+        elif todo:
+            try:
+                answer = await self._acomplete(
+                    self._build_batch_messages([texts[i] for i in todo], source_lang, target_langs), 'batch', deadline
+                )
+            except Exception as e:
+                logger.error("Batch translation failed: %s", e)
+                answer = None
+            incomplete = self._merge_batch(texts, todo, answer, results, source_lang, target_langs)
+            singles = await asyncio.gather(*(
+                self.atranslate(texts[i], source_lang, target_langs, deadline) for i in incomplete
+            ))
+            for i, translations in zip(incomplete, singles):
+                results[i] = translations
+        return results
+
+    def _batch_todo(self, texts: List[str], source_lang: str,
+                    target_langs: List[str]) -> Tuple[List[Optional[Dict[str, str]]], List[int]]:
+        """Results filled from the cache, and the indexes that still need translating"""
+        results = [self._cache_get(text, source_lang, target_langs) for text in texts]
+        return results, [i for i, result in enumerate(results) if result is None]
+
+    def _build_batch_messages(self, texts: List[str], source_lang: str,
+                              target_langs: List[str]) -> List[Dict[str, str]]:
+        langs_str = ", ".join(target_langs)
+        system_prompt = (
+            f"Translate each numbered {source_lang} segment to {langs_str}. "
+            f"Output format: 'segment_number lang_code: translation' per line, "
+            f"for every segment and language. No extra text."
+        )
+        numbered = "\n".join(f"{n}: {text}" for n, text in enumerate(texts, 1))
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": numbered}
+        ]
+
+    def _merge_batch(self, texts: List[str], todo: List[int], answer: Optional[Tuple[str, str]],
+                     results: List[Optional[Dict[str, str]]], source_lang: str, target_langs: List[str]) -> List[int]:
+        """
+        Fill results from a batched (model, answer) completion; returns the
+        indexes it couldn't translate, which is all of them without an answer
+        """
+        if answer is None:
+            return list(todo)
+        model, output = answer
+        incomplete = []
+        for i, translations in zip(todo, self._parse_batch_translations(output, len(todo), target_langs)):
+            if self.is_complete(translations):
+                self._cache_put(texts[i], source_lang, target_langs, translations, model)
+                results[i] = translations
+            else:
+                incomplete.append(i)
+        return incomplete
+
+    def _parse_batch_translations(self, output: str, count: int, target_langs: List[str]) -> List[Dict[str, str]]:
+        """Parse a batched answer into one translation dictionary per segment"""
+        batch = [{} for _ in range(count)]
         for line in output.split('\n'):
-            if ': ' in line:
-                lang, trans = line.split(': ', 1)
-                lang = lang.strip().lower()
-                if lang in target_langs:
-                    translations[lang] = trans.strip()
-        # Add missing languages
+            match = BATCH_LINE.match(line)
+            if not match:
+                continue
+            number, lang, trans = int(match.group(1)), match.group(2).lower(), match.group(3).strip()
+            if 1 <= number <= count and lang in target_langs:
+                batch[number - 1][lang] = trans
+        return [self._fill_missing(translations, target_langs) for translations in batch]
+
+    def _parse_line(self, line: str, target_langs: List[str]):
+        """Parse one 'lang_code: translation' line, returning (lang_code, translation) or None"""
+        if ': ' in line:
+            lang, trans = line.split(': ', 1)
+            lang = lang.strip().lower()
+            if lang in target_langs:
+                return lang, trans.strip()
+        return None
+
+    def _fill_missing(self, translations: Dict[str, str], target_langs: List[str]) -> Dict[str, str]:
         for lang in target_langs:
             if lang not in translations:
                 translations[lang] = f"<Missing {lang} translation>"
-        return translations 
\ No newline at end of file
+        return translations
+
+    def _parse_translations(self, output: str, target_langs: List[str]) -> Dict[str, str]:
+        """Parse GPT's response into translation dictionary"""
+        translations = {}
+        for line in output.split('\n'):
+            parsed = self._parse_line(line, target_langs)
+            if parsed:
+                translations[parsed[0]] = parsed[1]
+        # Add missing languages
+        return self._fill_missing(translations, target_langs)
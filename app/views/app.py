@@ -1,23 +1,198 @@
-from flask import Flask, jsonify
-from ..models.transcription_model import TranscriptionModel
+import json
+import time
+from datetime import datetime, timezone
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
+from werkzeug.http import is_resource_modified
+from ..models.transcription_model import CONSUMER_ID, DEFAULT_CONSUMER, default_store, stream_store
+from ..models.metrics import DELIVERY_SECONDS, registry, tracer
+from ..controllers.latency_controller import latency_controllers
+from ..config import Config
 
 app = Flask(__name__)
-model = TranscriptionModel()
-
-@app.route('/api/transcriptions', methods=['GET'])
-def get_transcriptions():
-    # Get only the next unread transcription
-    transcription = model.get_next_unread_transcription()
-    if transcription:
-        # Create the JSON structure
-        json_data = {
-            "message": {
-                "original_text": transcription['original_text'],
-                "en_translation": transcription['en_translation'],
-                "nl_translation": transcription['nl_translation']
-            }
-        }
-        # Mark it as read before returning
-        model.mark_as_read(transcription['timestamp'])
-        return jsonify(json_data)
-    return jsonify({"message": None}) 
\ No newline at end of file
+
+
+def _to_message(transcription):
+    """Build the JSON structure returned to vMix for a stored transcription"""
+    return {
+        "original_text": transcription['original_text'],
+        "en_translation": transcription['en_translation'],
+        "nl_translation": transcription['nl_translation']
+    }
+
+
+def _store(stream_id):
+    """The default store, or the store of a stream in a multi-stream session"""
+    if stream_id is None:
+        return default_store()
+    store = stream_store(stream_id, create=False)
+    if store is None:
+        abort(404, description=f"Unknown stream '{stream_id}'")
+    return store
+
+
+def _served(transcription, endpoint, stream_id):
+    """Record how long a caption waited between being saved and being returned"""
+    saved_at = datetime.fromisoformat(transcription['timestamp'])
+    DELIVERY_SECONDS.observe(max((datetime.now() - saved_at).total_seconds(), 0.0), endpoint=endpoint)
+    tracer.served((stream_id, transcription['id']))
+
+
+def _consumer():
+    """The reader named by ?consumer=; each consumer has its own position in the transcript"""
+    consumer = request.args.get('consumer', DEFAULT_CONSUMER)
+    if not CONSUMER_ID.match(consumer):
+        abort(400, description="consumer must be 1-64 letters, digits, '.', '_' or '-'")
+    return consumer
+
+
+def _take_next(store, endpoint, stream_id, consumer, limit):
+    # ?since=<id> reads from an earlier point than the consumer's cursor, e.g. to catch up after joining
+    transcriptions = store.read_next(consumer, limit, request.args.get('since', type=int))
+    for transcription in transcriptions:
+        _served(transcription, endpoint, stream_id)
+    return transcriptions
+
+
+def _read_response(store, transcriptions, consumer):
+    """
+    {"message": ...} with the next transcription, as vMix expects, or with
+    ?limit=N a list of up to N transcriptions and the consumer's new cursor
+    """
+    if 'limit' not in request.args:
+        return jsonify({"message": _to_message(transcriptions[0]) if transcriptions else None})
+    return jsonify({
+        "messages": [_to_message(transcription) for transcription in transcriptions],
+        "cursor": transcriptions[-1]['id'] if transcriptions else store.get_cursor(consumer)
+    })
+
+
+def _read_limit():
+    return max(1, min(request.args.get('limit', 1, type=int), Config.READ_MAX_LIMIT))
+
+
+@app.route('/api/transcriptions', methods=['GET'], defaults={'stream_id': None})
+@app.route('/api/streams/<stream_id>/transcriptions', methods=['GET'])
+def get_transcriptions(stream_id):
+    # Get the transcriptions after this consumer's cursor and move the cursor past them
+    store = _store(stream_id)
+    consumer = _consumer()
+    transcriptions = _take_next(store, 'transcriptions', stream_id, consumer, _read_limit())
+    return _read_response(store, transcriptions, consumer)
+
+
+@app.route('/api/transcriptions/poll', methods=['GET'], defaults={'stream_id': None})
+@app.route('/api/streams/<stream_id>/transcriptions/poll', methods=['GET'])
+def poll_transcriptions(stream_id):
+    """Long-poll variant of /api/transcriptions: wait until a transcription is available"""
+    store = _store(stream_id)
+    consumer = _consumer()
+    limit = _read_limit()
+    timeout = min(request.args.get('timeout', Config.LONG_POLL_TIMEOUT, type=float), Config.LONG_POLL_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    version = store.notifier.version
+    while True:
+        transcriptions = _take_next(store, 'poll', stream_id, consumer, limit)
+        remaining = deadline - time.monotonic()
+        if transcriptions or remaining <= 0:
+            return _read_response(store, transcriptions, consumer)
+        # Woken immediately by in-process writers; the recheck covers writers in another process
+        version, _ = store.notifier.wait(version, min(remaining, Config.STORE_RECHECK_INTERVAL))
+
+
+@app.route('/api/transcriptions/history', methods=['GET'], defaults={'stream_id': None})
+@app.route('/api/streams/<stream_id>/transcriptions/history', methods=['GET'])
+def transcription_history(stream_id):
+    """
+    Transcriptions after ?since=<id>, oldest first, at most ?limit=<n> of them.
+    The body is streamed row by row, so a full archive export costs no more
+    memory than one page. Rows never change once saved, so the ETag (the
+    latest id) answers 304 to clients whose copy is current. Last-Modified
+    is informational only: several rows can share a second.
+    """
+    store = _store(stream_id)
+    since = max(request.args.get('since', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        abort(400, description="limit must be a positive number")
+
+    latest_id, latest_timestamp = store.get_latest()
+    etag = str(latest_id)
+    # Timestamps are stored in local time; HTTP dates are UTC
+    last_modified = datetime.fromisoformat(latest_timestamp).astimezone(timezone.utc) if latest_timestamp else None
+    headers = {'Cache-Control': 'no-cache'}
+    # Decided by the id alone; a row saved in the same second as the client's copy has the same timestamp
+    if not is_resource_modified(request.environ, etag=etag):
+        response = Response(status=304, headers=headers)
+    else:
+        def generate():
+            cursor = since
+            yield '{"messages": ['
+            for transcription in store.iter_transcriptions(since, limit, until=latest_id):
+                yield (',' if cursor != since else '') + json.dumps(transcription, ensure_ascii=False)
+                cursor = transcription['id']
+            yield f'], "cursor": {cursor}}}'
+
+        response = Response(generate(), mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+@app.route('/api/transcriptions/stream', methods=['GET'], defaults={'stream_id': None})
+@app.route('/api/streams/<stream_id>/transcriptions/stream', methods=['GET'])
+def stream_transcriptions(stream_id):
+    """
+    Server-Sent Events stream of new transcriptions.
+    Every client receives every transcription saved after it connected (or after
+    the id given in Last-Event-ID / ?since=), without touching the read flags.
+    While a segment is still being translated, `partial` events carry the
+    languages that are already finished.
+    """
+    store = _store(stream_id)
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+
+    def generate(last_id):
+        version = store.notifier.version
+        # Rows replayed for a reconnecting client say nothing about live delivery latency
+        live_from = store.get_latest_id()
+        if last_id is None:
+            last_id = live_from
+        last_sent = time.monotonic()
+        while True:
+            for transcription in store.get_transcriptions_after(last_id):
+                last_id = transcription['id']
+                if last_id > live_from:
+                    _served(transcription, 'stream', stream_id)
+                payload = json.dumps({"message": _to_message(transcription)}, ensure_ascii=False)
+                yield f"id: {last_id}\nevent: transcription\ndata: {payload}\n\n"
+                last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent >= Config.SSE_KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            version, events = store.notifier.wait(version, Config.STORE_RECHECK_INTERVAL)
+            for _, event, data in events:
+                if event == 'partial':
+                    payload = json.dumps({"message": data}, ensure_ascii=False)
+                    yield f"event: partial\ndata: {payload}\n\n"
+                    last_sent = time.monotonic()
+
+    return Response(
+        stream_with_context(generate(last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/latency', methods=['GET'])
+def latency_control():
+    """Target, settings, measured delay and recent adjustments of the latency controllers running in this process"""
+    return jsonify({name: controller.state() for name, controller in list(latency_controllers.items())})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline latency histograms, queue depths and error counters in Prometheus text format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,35 @@
+import argparse
+from app.config import Config
+from app.logging_config import setup_logging
+from app.models.subtitles import FORMATS
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Transcribe and translate recorded audio files")
+    parser.add_argument('input_dir', help="Directory of recordings (searched recursively)")
+    parser.add_argument('output_dir', help="Where subtitle files and the resume state are written")
+    parser.add_argument(
+        '--sessions', type=int, default=Config.BATCH_MAX_SESSIONS,
+        help="Files transcribed concurrently (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--stream', default=Config.BATCH_STREAM,
+        help="Store the captions as this stream, served at /api/streams/<id>/transcriptions (default: %(default)s)"
+    )
+    parser.add_argument(
+        '--formats', default='srt,vtt',
+        help=f"Comma-separated subtitle formats: {', '.join(FORMATS)} (default: %(default)s)"
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    formats = tuple(filter(None, (fmt.strip() for fmt in args.formats.split(','))))
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown subtitle format: {', '.join(sorted(unknown))}")
+
+    from app.controllers.batch_controller import BatchTranscriber
+    transcriber = BatchTranscriber(args.input_dir, args.output_dir, args.stream, args.sessions, formats)
+    summary = transcriber.run()
+    print(f"{summary['done']} done, {summary['skipped']} already done, {summary['failed']} failed")
+    if summary['failed']:
+        raise SystemExit("Run again to retry the failed files")
@@ -0,0 +1,215 @@
+"""
+End-to-end latency benchmark for the transcription pipeline.
+
+Feeds WAV files through the real TranscriptionController code path. The
+PyAudio stream is replaced by a file source paced at real time (or
+faster), and the controller talks to local mock Speechmatics and OpenAI
+servers. Reports speech-to-caption latency percentiles, throughput and
+memory use.
+
+    python -m benchmarks.latency recording.wav --speed 2 --openai-latency lognormal:0.9,0.35
+"""
+import argparse
+import bisect
+import json
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+
+from app.config import Config
+from .mock_openai import MockOpenAIServer
+from .mock_speechmatics import MockSpeechmaticsServer, load_script, synthetic_script
+
+
+class WavFileStream:
+    """
+    Drop-in for the PyAudio input stream that reads a WAV file at `speed` x real time.
+    After the end of the file it returns silence (so the recogniser can finalise) and sets `finished`.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.wav = wave.open(path, 'rb')
+        if (self.wav.getframerate(), self.wav.getnchannels(), self.wav.getsampwidth()) != \
+                (Config.SAMPLE_RATE, Config.CHANNELS, 2):
+            raise ValueError(f"{path}: expected {Config.SAMPLE_RATE} Hz, {Config.CHANNELS} channel, 16-bit PCM")
+        self.speed = speed
+        self.duration = self.wav.getnframes() / Config.SAMPLE_RATE
+        self.finished = threading.Event()
+        self.frames_read = 0
+        self.started_at = None
+
+    def read(self, frames, exception_on_overflow=True):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        data = self.wav.readframes(frames)
+        if len(data) < frames * 2:
+            self.finished.set()
+            data += bytes(frames * 2 - len(data))
+        self.frames_read += frames
+
+        # Pace like a live microphone: a chunk is available once it has been "spoken"
+        due = self.started_at + self.frames_read / Config.SAMPLE_RATE / self.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        self.wav.close()
+
+
+class LatencyProbe:
+    """
+    Instruments a controller: maps sent audio back to the wall time it was
+    captured and records when each segment's caption is committed.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.bytes_per_second = Config.SAMPLE_RATE * Config.CHANNELS * 2
+        self._sent_bytes = [0]
+        self._captured_at = [time.monotonic()]
+        self._segment_end = {}  # segment text -> [end_time, ...]
+        self.latencies = []
+        self.committed = 0
+
+        buffer_write = controller.audio_buffer.write
+        feed = controller.segmenter.feed
+        commit = controller._commit_translation
+
+        def write(data):
+            self._sent_bytes.append(self._sent_bytes[-1] + len(data))
+            self._captured_at.append(time.monotonic())
+            buffer_write(data)
+
+        def feed_segments(msg):
+            segments = feed(msg)
+            for segment in segments:
+                self._segment_end.setdefault(segment.text, []).append(segment.end_time)
+            return segments
+
+        def commit_segment(text, translations, trace=None, seq=None):
+            commit(text, translations, trace, seq)
+            ends = self._segment_end.get(text)
+            if ends:
+                captured = self._captured_at_audio_time(ends.pop(0))
+                self.latencies.append(time.monotonic() - captured)
+            self.committed += 1
+
+        controller.audio_buffer.write = write
+        controller.segmenter.feed = feed_segments
+        controller._commit_translation = commit_segment
+        controller.translation_pool.commit = commit_segment
+
+    def _captured_at_audio_time(self, audio_time):
+        """Wall time at which the audio Speechmatics timed at `audio_time` was captured"""
+        index = bisect.bisect_left(self._sent_bytes, int(audio_time * self.bytes_per_second))
+        return self._captured_at[min(index, len(self._captured_at) - 1)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def run_file(path, args):
+    stream = WavFileStream(path, speed=args.speed)
+    script = load_script(args.script) if args.script else synthetic_script(stream.duration)
+    speechmatics = MockSpeechmaticsServer(script, final_delay=args.final_delay).start()
+    openai_server = MockOpenAIServer(latency=args.openai_latency, target_langs=Config.TARGET_LANGUAGES).start()
+
+    Config.SPEECHMATICS_URL = speechmatics.url
+    Config.SPEECHMATICS_AUTH_TOKEN = 'benchmark'
+    Config.OPENAI_API_KEY = 'benchmark'
+    Config.OPENAI_API_BASE = openai_server.url
+    Config.VAD_ENABLED = not args.no_vad
+    if not args.cache:
+        Config.TRANSLATION_CACHE_SIZE = 0
+        Config.TRANSLATION_CACHE_FILE = None
+
+    from app.controllers.transcription_controller import TranscriptionController
+
+    tracemalloc.start()
+    controller = TranscriptionController(capture_audio=False)
+    controller.stream = stream
+    probe = LatencyProbe(controller)
+
+    started = time.monotonic()
+    controller.start()
+    stream.finished.wait()
+    controller.stop()
+    elapsed = time.monotonic() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    speechmatics.stop()
+    openai_server.stop()
+
+    latencies = probe.latencies
+    return {
+        'file': os.path.basename(path),
+        'audio_seconds': round(stream.duration, 2),
+        'wall_seconds': round(elapsed, 2),
+        'segments': probe.committed,
+        'gpt_requests': openai_server.requests,
+        'latency_p50': round(percentile(latencies, 50), 3),
+        'latency_p95': round(percentile(latencies, 95), 3),
+        'latency_p99': round(percentile(latencies, 99), 3),
+        'latency_mean': round(statistics.mean(latencies), 3) if latencies else float('nan'),
+        'segments_per_second': round(probe.committed / elapsed, 3),
+        'realtime_factor': round(stream.duration / elapsed, 2),
+        'python_peak_mb': round(peak / 2 ** 20, 2),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speech-to-caption latency benchmark with local API stand-ins")
+    parser.add_argument('wav', nargs='+', help="16 kHz mono 16-bit WAV files")
+    parser.add_argument('--speed', type=float, default=1.0, help="Playback speed relative to real time")
+    parser.add_argument('--openai-latency', default='lognormal:0.9,0.35',
+                        help="fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument('--script', help="JSON word timings to emit instead of synthetic words (use with --no-vad)")
+    parser.add_argument('--final-delay', type=float, default=1.0,
+                        help="Audio seconds the mock waits before finalising a word")
+    parser.add_argument('--no-vad', action='store_true', help="Send all audio, keeping script timings exact")
+    parser.add_argument('--cache', action='store_true', help="Keep the translation cache enabled")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    paths = [os.path.abspath(path) for path in args.wav]
+    if args.script:
+        args.script = os.path.abspath(args.script)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # The controller creates its store under ./data
+        os.chdir(workdir)
+        for path in paths:
+            results.append(run_file(path, args))
+
+    columns = list(results[0].keys())
+    print("\t".join(columns))
+    for result in results:
+        print("\t".join(str(result[c]) for c in columns))
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
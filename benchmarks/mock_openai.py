@@ -0,0 +1,129 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers in the formats TranslationModel parses ('lang_code: translation'
+per line, or 'N lang_code: translation' for numbered batches) after a delay
+drawn from a configurable latency distribution. Streaming requests are
+answered as server-sent events.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NUMBERED_SEGMENT = re.compile(r'^(\d+):\s*(.*)$')
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler from a spec string:
+      fixed:0.8           always 0.8 s
+      uniform:0.4,1.5     uniform between 0.4 and 1.5 s
+      lognormal:0.9,0.35  median 0.9 s, log-space sigma 0.35
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+class MockOpenAIServer:
+    def __init__(self, latency='lognormal:0.9,0.35', target_langs=('en', 'nl'), host='127.0.0.1', port=0):
+        self.sample_latency = parse_latency(latency)
+        self.target_langs = list(target_langs)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, messages):
+        """Build the completion text for a translation request"""
+        text = messages[-1]['content']
+        lines = []
+        segments = [NUMBERED_SEGMENT.match(line) for line in text.split('\n')]
+        if 'numbered' in messages[0]['content'] and all(segments):
+            for match in segments:
+                for lang in self.target_langs:
+                    lines.append(f"{match.group(1)} {lang}: [{lang}] {match.group(2)}")
+        else:
+            for lang in self.target_langs:
+                lines.append(f"{lang}: [{lang}] {text}")
+        return "\n".join(lines)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # Connection warm-up requests
+                self._send_json({'object': 'list', 'data': [{'id': 'gpt-4', 'object': 'model'}]})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.sample_latency())
+                content = server.answer(request.get('messages', [{'content': ''}]))
+
+                if not request.get('stream'):
+                    self._send_json({
+                        'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': int(time.time()),
+                        'model': request.get('model', 'gpt-4'),
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': content}}],
+                        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for token in re.findall(r'\S+\s*', content):
+                    chunk = {
+                        'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                        'model': request.get('model', 'gpt-4'),
+                        'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
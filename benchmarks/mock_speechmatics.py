@@ -0,0 +1,122 @@
+"""
+Local stand-in for the Speechmatics real-time websocket API.
+
+Speaks enough of the protocol for speechmatics.client.WebsocketClient:
+StartRecognition -> RecognitionStarted, one AudioAdded per binary audio
+frame, scripted AddTranscript messages, and EndOfTranscript after
+EndOfStream. Audio is not recognised: each scripted word is emitted as a
+final once the received audio passes its end time plus `final_delay`.
+"""
+import asyncio
+import json
+import threading
+
+import websockets
+
+BYTES_PER_SECOND = 16000 * 2  # pcm_s16le, 16 kHz mono
+
+
+def synthetic_script(duration, words_per_second=2.5, sentence_words=8):
+    """Evenly spaced words ('w0', 'w1', ...) with a full stop every `sentence_words` words"""
+    results = []
+    step = 1.0 / words_per_second
+    for i in range(int(duration * words_per_second)):
+        start_time = i * step
+        end_time = start_time + step * 0.8
+        results.append({
+            'type': 'word', 'start_time': start_time, 'end_time': end_time,
+            'alternatives': [{'content': f"w{i}", 'confidence': 1.0}]
+        })
+        if (i + 1) % sentence_words == 0:
+            results.append({
+                'type': 'punctuation', 'start_time': end_time, 'end_time': end_time, 'is_eos': True,
+                'attaches_to': 'previous', 'alternatives': [{'content': '.', 'confidence': 1.0}]
+            })
+    return results
+
+
+def load_script(path):
+    """Read scripted results: a JSON list of result objects, or a Speechmatics transcript with a 'results' key"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data['results'] if isinstance(data, dict) else data
+
+
+class MockSpeechmaticsServer:
+    def __init__(self, script, final_delay=1.0, host='127.0.0.1', port=0):
+        self.script = sorted(script, key=lambda r: r['end_time'])
+        self.final_delay = final_delay
+        self.host = host
+        self.port = port
+        self.sessions = 0
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/v2"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mock-speechmatics", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            websockets.serve(self._session, self.host, self.port, max_size=None)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    async def _session(self, websocket, path=None):
+        self.sessions += 1
+        received = 0
+        seq_no = 0
+        pending = list(self.script)
+
+        async def emit(until):
+            nonlocal pending
+            ready = [r for r in pending if r['end_time'] <= until]
+            if not ready:
+                return
+            pending = pending[len(ready):]
+            transcript = " ".join(r['alternatives'][0]['content'] for r in ready)
+            await websocket.send(json.dumps({
+                'message': 'AddTranscript',
+                'metadata': {
+                    'transcript': transcript,
+                    'start_time': ready[0]['start_time'],
+                    'end_time': ready[-1]['end_time'],
+                },
+                'results': ready,
+            }))
+
+        async for message in websocket:
+            if isinstance(message, bytes):
+                received += len(message)
+                seq_no += 1
+                await websocket.send(json.dumps({'message': 'AudioAdded', 'seq_no': seq_no}))
+                await emit(received / BYTES_PER_SECOND - self.final_delay)
+                continue
+
+            msg = json.loads(message)
+            if msg['message'] == 'StartRecognition':
+                await websocket.send(json.dumps({'message': 'RecognitionStarted', 'id': f"mock-{self.sessions}"}))
+            elif msg['message'] == 'EndOfStream':
+                # Everything heard so far is final once the stream ends
+                await emit(received / BYTES_PER_SECOND)
+                await websocket.send(json.dumps({'message': 'EndOfTranscript'}))
+                break
@@ -4,12 +4,12 @@
 # ####################################################################
 # ####################################################################
 
-import openai
 import os
 import pyaudio
+import socket
 import threading
-import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
 import speechmatics
 from speechmatics.models import (
     ConnectionSettings,
@@ -17,7 +17,13 @@ from speechmatics.models import (
     AudioSettings,
     ServerMessageType
 )
+from app.logging_config import setup_logging
+from app.models import openai_client
 from app.models.transcription_model import TranscriptionModel
+from app.models.translation_model import TranslationModel
+from app.controllers.speculative_translator import SpeculativeTranslator
+from app.controllers.segmenter import Segmenter
+from app.controllers.audio_stream import AudioRingBuffer, VoiceActivityGate
 
 # =====================
 # Configuration
@@ -36,149 +42,131 @@ SAMPLE_RATE = 16000
 CHANNELS = 1
 FORMAT = pyaudio.paInt16
 SAMPLE_WIDTH = 2
+SEND_CHUNK_SIZE = 8192  # Max bytes per websocket frame; buffered audio is sent in frames up to this size
+AUDIO_MAX_LAG = 5.0  # Seconds of unsent audio kept; older audio is dropped to catch up
+
+# Translate stable prefixes of partial transcripts before they are final
+SPECULATIVE_TRANSLATION = False
 
 # Set OpenAI API key from environment variable
-# openai.api_key = os.getenv("OPENAI_API_KEY")
-# if not openai.api_key:
+# OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# if not OPENAI_API_KEY:
 #     raise ValueError("Please set the OPENAI_API_KEY environment variable")
-openai.api_key = "api_key"
+OPENAI_API_KEY = "api_key"
+# One pooled client for every translation thread; its rate limiter keeps them under the API limits
+openai_client.configure(api_key=OPENAI_API_KEY)
 
 
 # =====================
 # Global Variables
 # =====================
-audio_queue = queue.Queue()
-transcript_buffer = ""
+audio_buffer = AudioRingBuffer(SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH, max_lag=AUDIO_MAX_LAG)
+# Cut segments on punctuation, pauses, 10 words (slightly lower word threshold) or 6 seconds
+segmenter = Segmenter(max_words=10, max_duration=6.0, pause_threshold=0.8)
 print_lock = threading.Lock()
-transcription_model = TranscriptionModel()  # Initialize the model
+transcription_model = None  # Opened by warm_up()
+translation_model = None  # Opened by warm_up()
+ws = None  # Created by warm_up()
 
 # =====================
 # GPT Translation
 # =====================
-def translate_with_gpt4(text: str, source_lang: str, target_langs: list) -> dict:
+def translate(text: str) -> dict:
     """
-    Single API call for all target languages
+    Single API call for all target languages, within the translation deadline,
+    hedged and retried like the app's own pipeline
     Returns dictionary of {lang: translation}
     """
-    try:
-        langs_str = ", ".join(target_langs)
-        system_prompt = (
-            f"Translate this {source_lang} text to {langs_str}. "
-            f"Output format: 'lang_code: translation' per line. "
-            f"No extra text."
-        )
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.0,
-        )
-        translated_output = response["choices"][0]["message"]["content"].strip()
-        return parse_translations(translated_output, target_langs)
-    except Exception as e:
-        return {lang: f"<Error: {e}>" for lang in target_langs}
-
-def parse_translations(output: str, target_langs: list) -> dict:
-    """Parse GPT's response into translation dictionary"""
-    translations = {}
-    for line in output.split('\n'):
-        if ': ' in line:
-            lang, trans = line.split(': ', 1)
-            lang = lang.strip().lower()
-            if lang in target_langs:
-                translations[lang] = trans.strip()
-    # Add missing languages
-    for lang in target_langs:
-        if lang not in translations:
-            translations[lang] = f"<Missing {lang} translation>"
-    return translations
+    return translation_model.translate(text, "Persian", TARGET_LANGUAGES)
 
 # =====================
 # Speechmatics Client
 # =====================
-ws = speechmatics.client.WebsocketClient(
-    ConnectionSettings(
-        url=CONNECTION_URL,
-        auth_token=SPEECHMATICS_AUTH_TOKEN
+def create_client():
+    client = speechmatics.client.WebsocketClient(
+        ConnectionSettings(
+            url=CONNECTION_URL,
+            auth_token=SPEECHMATICS_AUTH_TOKEN
+        )
+    )
+    client.add_event_handler(
+        event_name=ServerMessageType.AddTranscript,
+        event_handler=handle_final_transcript
+    )
+    # Partials are only needed for speculative translation
+    if speculator:
+        client.add_event_handler(
+            event_name=ServerMessageType.AddPartialTranscript,
+            event_handler=handle_partial_transcript
+        )
+    return client
+
+speculator = None
+if SPECULATIVE_TRANSLATION:
+    speculator = SpeculativeTranslator(
+        translate=translate,
+        is_segment_end=segmenter.would_end
     )
-)
+
+def handle_partial_transcript(msg):
+    speculator.on_partial(segmenter.text, msg['metadata']['transcript'])
 
 def handle_final_transcript(msg):
-    global transcript_buffer
-    final_text = msg['metadata']['transcript'].strip()
-    transcript_buffer += " " + final_text
-    
+    if speculator:
+        speculator.on_final()
     # Trigger translation when natural breakpoint detected
-    if final_text.endswith(('.', '!', '?')) or len(transcript_buffer.split()) >= 10:  # Slightly lower word threshold
-        persian_text = transcript_buffer.strip()
-        transcript_buffer = ""  # Immediate reset
+    for segment in segmenter.feed(msg):
+        translate_segment(segment.text)
+
+def translate_segment(persian_text):
+    if speculator:
+        speculator.claim(persian_text)
+
+    with print_lock:
+        print(f"\n[Original] {persian_text}")
+
+    # Process translation without blocking
+    def process_translation():
+        start_time = time.time()
+        translations = speculator.take(persian_text) if speculator else None
+        if translations is None:
+            translations = translate(persian_text)
+        duration = time.time() - start_time
         
         with print_lock:
-            print(f"\n[Original] {persian_text}")
-
-        # Process translation without blocking
-        def process_translation():
-            start_time = time.time()
-            translations = translate_with_gpt4(persian_text, "Persian", TARGET_LANGUAGES)
-            duration = time.time() - start_time
-            
-            with print_lock:
-                for lang in TARGET_LANGUAGES:
-                    print(f"[{lang.upper()}] {translations.get(lang, '')}")
-                print(f"Translation took {duration:.2f}s\n")
-            
-            # Save to CSV
-            try:
-                transcription_model.save_transcription(persian_text, translations)
-                print("Saved transcription to CSV file")
-            except Exception as e:
-                print(f"Error saving to CSV: {e}")
+            for lang in TARGET_LANGUAGES:
+                print(f"[{lang.upper()}] {translations.get(lang, '')}")
+            print(f"Translation took {duration:.2f}s\n")
         
-        threading.Thread(target=process_translation).start()
-
-# Only register final transcript handler
-ws.add_event_handler(
-    event_name=ServerMessageType.AddTranscript,
-    event_handler=handle_final_transcript
-)
+        # Save to the transcription store; a failed translation is stored blank rather than as an error on air
+        try:
+            transcription_model.save_transcription(persian_text, TranslationModel.for_display(translations))
+            print("Saved transcription")
+        except Exception as e:
+            print(f"Error saving transcription: {e}")
+    
+    threading.Thread(target=process_translation).start()
 
-# Speechmatics configuration without partials
+# Speechmatics configuration
 settings = AudioSettings(
     encoding="pcm_s16le",
     sample_rate=SAMPLE_RATE,
-    chunk_size=CHUNK_SIZE
+    chunk_size=SEND_CHUNK_SIZE
 )
 
 config = TranscriptionConfig(
     language=SOURCE_LANGUAGE,
-    enable_partials=False,  # Partials disabled
+    enable_partials=SPECULATIVE_TRANSLATION,
     max_delay=2.5,  # More aggressive finalization
     operating_point="enhanced"
 )
 
 # =====================
-# Audio Capture (unchanged)
+# Audio Capture
 # =====================
-class QueueStream:
-    def __init__(self, q):
-        self.queue = q
-        self.running = True
-
-    def read(self, num_bytes):
-        while self.running:
-            try:
-                data = self.queue.get(timeout=2)
-                if data is None:
-                    self.running = False
-                    return b""
-                return data
-            except queue.Empty:
-                continue
-        return b""
-
 def capture_audio():
+    # Long pauses are reduced to keep-alive silence; the hangover outlasts max_delay
+    gate = VoiceActivityGate(sample_rate=SAMPLE_RATE, hangover=3.0)
     p = pyaudio.PyAudio()
     stream = p.open(
         format=FORMAT,
@@ -191,12 +179,32 @@ def capture_audio():
     try:
         while True:
             data = stream.read(CHUNK_SIZE, exception_on_overflow=False)
-            audio_queue.put(data)
+            for chunk in gate.process(data):
+                audio_buffer.write(chunk)
     except KeyboardInterrupt:
         stream.stop_stream()
         stream.close()
         p.terminate()
-        audio_queue.put(None)
+        audio_buffer.close()
+
+# =====================
+# Warm-up
+# =====================
+def warm_up():
+    """
+    Open the store and translation cache, create the Speechmatics client,
+    resolve its host and connect to OpenAI, all at once
+    """
+    global transcription_model, translation_model, ws
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        store = executor.submit(TranscriptionModel)
+        translator = executor.submit(TranslationModel, speculations=2 if SPECULATIVE_TRANSLATION else 0)
+        client = executor.submit(create_client)
+        executor.submit(socket.getaddrinfo, CONNECTION_URL.split('/')[2], 443)
+        executor.submit(openai_client.warm_up, 2)
+    transcription_model, translation_model, ws = store.result(), translator.result(), client.result()
+    print(f"Warm-up finished in {time.time() - started:.2f}s")
 
 # =====================
 # Main Execution
@@ -204,20 +212,25 @@ def capture_audio():
 if __name__ == "__main__":
     print("Live Persian-to-Multilingual Translator")
     print("=======================================")
-    
+    setup_logging()
+
+    # The microphone opens while the connections warm up
     audio_thread = threading.Thread(target=capture_audio)
     audio_thread.daemon = True
     audio_thread.start()
-
-    time.sleep(0.5)  # Shorter initial delay
+    warm_up()
 
     try:
-        ws.run_synchronously(QueueStream(audio_queue), config, settings)
+        ws.run_synchronously(audio_buffer, config, settings)
     except Exception as e:
         print(f"Fatal error: {e}")
     finally:
-        if transcript_buffer:
-            translations = translate_with_gpt4(transcript_buffer, "Persian", TARGET_LANGUAGES)
+        segment = segmenter.flush()
+        if segment:
+            translations = translate(segment.text)
             print("\nFinal translations:")
             for lang in TARGET_LANGUAGES:
                 print(f"[{lang.upper()}] {translations.get(lang, '')}")
+        if speculator:
+            speculator.shutdown()
+            print(f"Speculative translation: {speculator.stats}")
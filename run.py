@@ -1,4 +1,53 @@
+import argparse
+from app.config import Config
+from app.logging_config import setup_logging
 from app.views.app import app
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="JSON server for vMix")
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help="Run transcription and translation in this process so new captions are pushed to clients immediately"
+    )
+    parser.add_argument(
+        '--async-pipeline', action='store_true',
+        help="Like --pipeline, but run every pipeline stage on a single asyncio event loop"
+    )
+    parser.add_argument(
+        '--streams', metavar='ID[=DEVICE],...', default=Config.STREAMS,
+        help="Run one pipeline per audio input, e.g. hall=2,room-b=5; served at /api/streams/<id>/transcriptions (default: $STREAMS)"
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.streams:
+        from app.controllers.session_manager import SessionManager
+        manager = SessionManager(SessionManager.parse_streams(args.streams))
+        manager.start()
+        try:
+            app.run(debug=True, use_reloader=False, threaded=True)
+        finally:
+            manager.stop()
+    elif args.async_pipeline:
+        import asyncio
+        import threading
+        from app.controllers.async_pipeline import AsyncTranscriptionPipeline
+        pipeline = AsyncTranscriptionPipeline()
+        pipeline_thread = threading.Thread(target=asyncio.run, args=(pipeline.run(),), daemon=True)
+        pipeline_thread.start()
+        try:
+            app.run(debug=True, use_reloader=False, threaded=True)
+        finally:
+            pipeline.stop()
+            pipeline_thread.join(timeout=10)
+    elif args.pipeline:
+        from app.controllers.transcription_controller import TranscriptionController
+        controller = TranscriptionController()
+        controller.start()
+        try:
+            # The reloader would start a second pipeline in its child process
+            app.run(debug=True, use_reloader=False, threaded=True)
+        finally:
+            controller.stop()
+    else:
+        app.run(debug=True, threaded=True)